@@ -0,0 +1,347 @@
+"""
+Exact-match answer cache
+========================
+What this does:
+    Most of our traffic is the same handful of questions ("zero hours
+    contracts", "sick pay"). Each one costs a retrieval plus a remote LLM
+    call. This cache remembers finished answers and serves repeats
+    instantly.
+
+    The cache key covers everything that can change the answer:
+      - the question, normalised (case, spacing, trailing punctuation),
+      - retrieval parameters (k, source/page filters),
+      - the LLM and embedding model ids,
+      - the corpus version (see corpus_version.py) — any build, upload
+        or cleanup makes every older entry unreachable,
+      - the recent chat history that goes into the prompt.
+
+Backends (ANSWER_CACHE_BACKEND):
+    memory  — in-process LRU (default with one API worker)
+    sqlite  — on-disk SQLite file; survives restarts and is shared by
+              every worker process on the machine (default when
+              API_WORKERS > 1)
+    off     — no caching
+
+Both backends evict least-recently-used entries above ANSWER_CACHE_SIZE
+and treat entries older than ANSWER_CACHE_TTL seconds as misses.
+
+Semantic cache (SemanticAnswerCache):
+    Catches paraphrases ("sick pay changes?" vs "what changes affect
+    sick pay") that the exact cache misses. It keeps the embeddings of
+    previously answered questions in a small in-memory matrix. A new
+    question is a hit when
+      - its cosine similarity to a cached question is at least
+        SEMANTIC_CACHE_THRESHOLD, and
+      - retrieval returned the SAME set of chunks for it.
+    The chunk check is what keeps it safe: a paraphrase that pulls
+    different context gets a fresh answer. The question vector is the one
+    retrieval already computed, so a lookup costs one matrix-vector product.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from settings import API_WORKERS, CACHE_DIR, open_sqlite
+
+# Several API workers (API_WORKERS > 1) only share a cache on disk
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "sqlite" if API_WORKERS > 1 else "memory")
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(CACHE_DIR, "answer_cache.sqlite3"))
+
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", str(ANSWER_CACHE_SIZE)))
+
+
+def normalise_question(question: str) -> str:
+    """'  What about SICK pay?? ' → 'what about sick pay'"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+def make_key(question: str, **params) -> str:
+    """Stable hash of the normalised question + everything else that shapes the answer."""
+    return make_scope_key(question=normalise_question(question), **params)
+
+
+def make_scope_key(**params) -> str:
+    """Stable hash of the answer parameters alone (no question) — the semantic cache's scope."""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """Shared bookkeeping: hit/miss counters. Subclasses store the values."""
+
+    backend = "none"
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: int = ANSWER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _record(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, value: dict):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend,
+                "entries": len(self),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class InMemoryAnswerCache(AnswerCache):
+    """LRU + TTL in a plain OrderedDict (most recently used at the end)."""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: int = ANSWER_CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self._record(entry is not None)
+        return entry[1] if entry is not None else None
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteAnswerCache(AnswerCache):
+    """
+    LRU + TTL in a SQLite file. WAL mode lets several worker processes
+    read while one writes.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, max_entries: int = ANSWER_CACHE_SIZE,
+                 ttl: int = ANSWER_CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " stored_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+        self._record(row is not None)
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: dict):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, value, stored_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                " SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        if evicted > 0:
+            with self._stats_lock:
+                self.evictions += evicted
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+class SemanticAnswerCache:
+    """
+    Question-embedding similarity cache.
+
+    Rows of one preallocated float32 matrix hold the (L2-normalised)
+    question vectors; the entry for each row sits at the same index in
+    self._entries. Entries only match lookups with the same scope key
+    (filters, models, corpus version, history — see make_scope_key).
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_SIZE, ttl: int = ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors = None  # (max_entries, dim), allocated on the first set()
+        self._scopes = np.full(max_entries, None, dtype=object)
+        self._entries = [None] * max_entries  # dict(chunk_ids, value, stored_at, last_used)
+        self.hits = 0
+        self.misses = 0
+        self.near_misses = 0  # similar enough, but retrieval returned other chunks
+        self.evictions = 0
+
+    @staticmethod
+    def _normalise(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, scope: str, vector, chunk_ids):
+        """Cached value for a similar question with the same chunks, else None."""
+        chunk_ids = frozenset(chunk_ids)
+        now = time.time()
+        with self._lock:
+            value = None
+            if self._vectors is not None:
+                similarity = self._vectors @ self._normalise(vector)
+                similarity[self._scopes != scope] = -np.inf
+                # Best candidate first; stop at the first one with the same chunks
+                for row in np.argsort(-similarity):
+                    if similarity[row] < self.threshold:
+                        break
+                    entry = self._entries[row]
+                    if now - entry["stored_at"] > self.ttl:
+                        continue
+                    if entry["chunk_ids"] != chunk_ids:
+                        self.near_misses += 1
+                        continue
+                    entry["last_used"] = now
+                    value = entry["value"]
+                    break
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, scope: str, vector, chunk_ids, value: dict):
+        if self.max_entries <= 0:
+            return  # no rows to store into
+        vector = self._normalise(vector)
+        now = time.time()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+
+            # Free row if there is one, otherwise the least recently used
+            row = next((i for i, e in enumerate(self._entries) if e is None), None)
+            if row is None:
+                row = min(range(self.max_entries), key=lambda i: self._entries[i]["last_used"])
+                self.evictions += 1
+
+            self._vectors[row] = vector
+            self._scopes[row] = scope
+            self._entries[row] = {
+                "chunk_ids": frozenset(chunk_ids),
+                "value": value,
+                "stored_at": now,
+                "last_used": now,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._scopes[:] = None
+            self._entries = [None] * self.max_entries
+
+    def __len__(self):
+        with self._lock:
+            return sum(e is not None for e in self._entries)
+
+    def stats(self) -> dict:
+        entries = len(self)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "near_misses": self.near_misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+def create_answer_cache(backend: str = ANSWER_CACHE_BACKEND) -> AnswerCache:
+    """Builds the cache selected by ANSWER_CACHE_BACKEND."""
+    if backend == "memory":
+        return InMemoryAnswerCache()
+    if backend == "sqlite":
+        return SQLiteAnswerCache()
+    if backend == "off":
+        return AnswerCache()
+    raise ValueError(f"Unknown ANSWER_CACHE_BACKEND '{backend}'. Choose memory, sqlite or off.")
+
+
+def create_semantic_cache(enabled: bool = SEMANTIC_CACHE, max_entries: int = SEMANTIC_CACHE_SIZE):
+    """SemanticAnswerCache, or None when SEMANTIC_CACHE=0 or SEMANTIC_CACHE_SIZE=0."""
+    return SemanticAnswerCache(max_entries=max_entries) if enabled and max_entries > 0 else None
@@ -6,10 +6,16 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # from fastapi import FastAPI, HTTPException
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
 import uvicorn
+import json
+import time
+import asyncio
+import functools
 
 # from rag_chain import ask
 # import sys
@@ -19,17 +25,65 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from rag_chain import ask
+_import_started = time.perf_counter()
+from rag_chain import (
+    ask_async, ask_batch, ask_stream, retrieve_batch_async, RETRIEVAL_K,
+    cache_stats, concurrency_stats, component_status, warm_up,
+)
+RAG_IMPORT_SECONDS = time.perf_counter() - _import_started
+from concurrency import BoundedExecutor, ExecutorSaturated
+from jobs import create_job_store, run_job
+from uploads import UploadRejected, receive_pdf
 
 # from rag_chain import ask, initialize  # your existing import stays the same
 
 class QuestionRequest(BaseModel):
     question: str
+    # Whose conversation this continues (app.py sends one id per browser session)
+    session_id: str = "default"
+    # Optional retrieval filters: only search one document and/or a page range
+    source: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+
+    def filters(self) -> dict:
+        return {"source": self.source, "page_from": self.page_from, "page_to": self.page_to}
 
 class AnswerResponse(BaseModel):
     answer: str
     sources: list
     num_chunks: int
+    cached: bool = False
+    # Tokens per prompt part (system/context/history/question/total); None when served from cache
+    prompt_tokens: Optional[dict] = None
+
+# Largest batch one /retrieve/batch or /ask/batch call accepts
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+
+class BatchRequest(BaseModel):
+    questions: list[str]
+    # Filters apply to every question in the batch
+    source: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    # /retrieve/batch only — /ask/batch always sends the usual RETRIEVAL_K chunks to the LLM
+    k: int = RETRIEVAL_K
+
+    def filters(self) -> dict:
+        return {"source": self.source, "page_from": self.page_from, "page_to": self.page_to}
+
+    def validate_questions(self):
+        if not self.questions:
+            raise HTTPException(status_code=400, detail="questions cannot be empty")
+        if len(self.questions) > BATCH_MAX_QUESTIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many questions ({len(self.questions)}). Maximum {BATCH_MAX_QUESTIONS} per batch.",
+            )
+        if any(not q.strip() for q in self.questions):
+            raise HTTPException(status_code=400, detail="Questions cannot be empty")
+        if not 1 <= self.k <= 50:
+            raise HTTPException(status_code=400, detail="k must be between 1 and 50")
 
 app = FastAPI(
     title="UK Legal RAG API",
@@ -45,10 +99,82 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# /ask is natively async (see rag_chain.ask_async). Uploads and cleanup are
+# still blocking (PDF parsing, embedding, Chroma writes), so they run on their
+# own small pool — the event loop stays free and a burst of PDFs can't starve /ask.
+ingest_executor = BoundedExecutor(
+    "ingest",
+    int(os.getenv("INGEST_MAX_CONCURRENCY", "2")),
+    int(os.getenv("INGEST_MAX_QUEUE", "4")),
+)
+
+
+# Status of background upload jobs, polled through /jobs/{job_id}
+job_store = create_job_store()
+
+# /upload reads the body itself (uploads.receive_pdf), so describe it for /docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+def saturated_response(e: ExecutorSaturated) -> HTTPException:
+    """503 + Retry-After so clients back off instead of hammering us."""
+    return HTTPException(
+        status_code=503,
+        detail=f"Server busy: {e}",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    """
+    Load the embedding model, ChromaDB and ping the LLM in the background.
+    The server accepts connections straight away: /health answers at once,
+    /ready flips to 200 when warm-up has loaded the retriever.
+    """
+    print(f"✅ rag_chain import took {RAG_IMPORT_SECONDS:.2f}s — warming up in the background")
+    app.state.warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+
+
+@app.on_event("shutdown")
+async def shutdown_executors():
+    # Queued uploads are cancelled; their done callbacks fail the jobs (see upload_pdf)
+    await asyncio.to_thread(ingest_executor.shutdown)
+
 @app.get("/health")
 async def health_check():
-    """Quick check that the server is running."""
-    return {"status": "healthy"}
+    """Liveness: the server process is up. Never touches the models."""
+    return {
+        "status": "healthy",
+        "executors": {
+            **concurrency_stats(),
+            "ingest": ingest_executor.stats(),
+        },
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once the retriever is loaded, 503 (with details) before."""
+    status = component_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/cache/stats")
+async def cache_statistics():
+    """Hit/miss counts and sizes of the answer cache."""
+    return await asyncio.to_thread(cache_stats)  # SQLite-backed stores count rows
 
 @app.post("/ask", response_model=AnswerResponse)
 async def ask_question(request: QuestionRequest):
@@ -60,58 +186,216 @@ async def ask_question(request: QuestionRequest):
         raise HTTPException(status_code=400, detail="Question cannot be empty")
     
     try:
-        result = ask(request.question)
+        result = await ask_async(request.question, request.filters(), request.session_id)
         return AnswerResponse(
             answer=result["answer"],
             sources=result["sources"],
-            num_chunks=result["num_chunks"]
+            num_chunks=result["num_chunks"],
+            cached=result.get("cached", False),
+            prompt_tokens=result.get("prompt_tokens"),
         )
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG pipeline error: {str(e)}")
     
-@app.post("/upload")
-async def upload_pdf(file: UploadFile = File(...), session_id: str = "default"):
+@app.post("/retrieve/batch")
+async def retrieve_questions_batch(request: BatchRequest):
+    """
+    Top-k chunks for many questions in one call — no LLM. All questions are
+    embedded in one model call and searched together (see rag_chain.retrieve_batch).
+    """
+    request.validate_questions()
     try:
-        if not file.filename.lower().endswith(".pdf"):
-            raise HTTPException(status_code=400, detail="Only PDF files are accepted.")
-        
-        pdf_bytes = await file.read()
-        
-        if len(pdf_bytes) == 0:
+        docs_per_question = await retrieve_batch_async(request.questions, request.filters(), request.k)
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"RAG pipeline error: {str(e)}")
+
+    return {
+        "results": [
+            {
+                "question": question,
+                "chunks": [
+                    {"id": doc.id, "text": doc.page_content, "metadata": doc.metadata}
+                    for doc in docs
+                ],
+            }
+            for question, docs in zip(request.questions, docs_per_question)
+        ]
+    }
+
+
+@app.post("/ask/batch")
+async def ask_questions_batch(request: BatchRequest):
+    """
+    Answers many independent questions in one call (no chat history).
+    Results come back in the same order as the questions.
+    """
+    request.validate_questions()
+    try:
+        results = await ask_batch(request.questions, request.filters())
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"RAG pipeline error: {str(e)}")
+
+    return {
+        "results": [
+            {"question": question, **result}
+            for question, result in zip(request.questions, results)
+        ]
+    }
+
+
+def sse_event(event: str, data: dict) -> str:
+    """One Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Same as /ask, but streams the answer as Server-Sent Events:
+    a 'sources' event first, then 'token' events as the LLM writes,
+    then 'done' (or 'error').
+    """
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    events = ask_stream(request.question, request.filters(), request.session_id)
+
+    # Pull the first event before committing to a 200 streaming response,
+    # so saturation and retrieval failures still get proper status codes.
+    try:
+        first_event = await events.__anext__()
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"RAG pipeline error: {str(e)}")
+
+    async def event_stream():
+        try:
+            yield sse_event(*first_event)
+            async for event in events:
+                yield sse_event(*event)
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/upload", status_code=202, openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_pdf(request: Request, session_id: str = "default"):
+    """
+    Accepts a PDF and queues it for indexing. Answers 202 with a job_id
+    straight away — poll /jobs/{job_id} for progress (see jobs.py).
+
+    The file is streamed to a temporary file as it arrives (uploads.py):
+    oversized uploads are refused before or while they are read, and the
+    PDF is never held in memory whole.
+    """
+    path = None
+    try:
+        path, filename, size = await receive_pdf(request)
+
+        if size == 0:
             raise HTTPException(status_code=400, detail="Empty file uploaded.")
         
-        if len(pdf_bytes) > 50 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File too large. Maximum 50MB.")
-        
-        from rag_chain import ingest_pdf_bytes
-        result = ingest_pdf_bytes(pdf_bytes, file.filename, session_id)
-        
-        if "error" in result:
-            raise HTTPException(status_code=400, detail=result["error"])
+        job = await asyncio.to_thread(job_store.create, "ingest", filename=filename, session_id=session_id)
+        try:
+            # Admission control still applies: a full ingest queue answers 503
+            future = ingest_executor.submit(run_job, job_store, job["job_id"], ingest_upload,
+                                            path, filename, session_id)
+        except ExecutorSaturated:
+            await asyncio.to_thread(job_store.update, job["job_id"], status="failed", stage="Failed",
+                                    error="Server busy")
+            raise
+        future.add_done_callback(functools.partial(fail_if_cancelled, job["job_id"], path))
+        path = None  # the job owns the file now
         
         return {
-            "message": f"Successfully processed {file.filename}",
-            "chunks_added": result["chunks_added"],
-            "filename": file.filename
+            "message": f"Processing {filename}",
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "filename": filename
         }
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except HTTPException:
         raise
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
+    finally:
+        if path is not None:
+            os.remove(path)
+
+
+def fail_if_cancelled(job_id: str, path: str, future):
+    """
+    Done callback of an upload job. A job still queued at shutdown is
+    cancelled and never reaches ingest_upload(), so fail it here and
+    delete its spooled file — instead of a job stuck at "queued".
+    """
+    if not future.cancelled():
+        return
+    try:
+        job_store.update(job_id, status="failed", stage="Failed",
+                         error="Server shut down before the upload was indexed. Please upload it again.")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def ingest_upload(path: str, filename: str, session_id: str, progress=None) -> dict:
+    """The body of an upload job (runs on the ingest pool). Deletes the spooled file after."""
+    from rag_chain import ingest_pdf_file
+    try:
+        result = ingest_pdf_file(path, filename, session_id, progress=progress)
+    finally:
+        os.remove(path)
+    if "error" in result:
+        return {"error": result["error"]}
+    return {"chunks_added": result["chunks_added"], "filename": filename}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status, stage and progress of a background job (e.g. an upload)."""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id.")
+    return job
 
 
 @app.post("/cleanup")
 async def cleanup_session(session_id: str = "default"):
     try:
         from rag_chain import cleanup_session_chunks
-        result = cleanup_session_chunks(session_id)
+        result = await ingest_executor.run(cleanup_session_chunks, session_id)
         return {
             "message": f"Cleaned up {result['chunks_removed']} uploaded chunks",
             "chunks_removed": result["chunks_removed"]
         }
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Cleanup failed: {str(e)}")
 
+@app.post("/history/clear")
+async def clear_history(session_id: str = "default"):
+    """Forgets the conversation memory of one session."""
+    from rag_chain import session_store
+    await asyncio.to_thread(session_store.clear, session_id)
+    return {"message": "Conversation history cleared", "session_id": session_id}
+
 # @app.get("/debug_db")
 # async def debug_db():
 #     from rag_chain import vectorstore
@@ -2,8 +2,8 @@
 Phase 4: Streamlit Chat UI for UK Legal RAG Pipeline
 =====================================================
 This is the "face" of the application — the web interface recruiters will click.
-It sends questions to the FastAPI backend (/ask endpoint) and displays answers
-in a professional chat format.
+It sends questions to the FastAPI backend (/ask/stream endpoint) and displays
+answers token-by-token in a professional chat format.
 
 """
 
@@ -11,12 +11,15 @@ import streamlit as st
 import requests
 import time
 import os
+import json
 
 # ============================================================
 # CONFIGURATION
 # ============================================================
 # Where  FastAPI server is running
 API_URL = os.getenv("API_URL", "http://localhost:8000")
+# Longest we keep polling an upload job before giving up on it
+UPLOAD_POLL_TIMEOUT = int(os.getenv("UPLOAD_POLL_TIMEOUT", "900"))
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -95,7 +98,12 @@ with st.sidebar:
     try:
         health = requests.get(f"{API_URL}/health", timeout=5)
         if health.status_code == 200:
-            st.markdown('<p class="status-connected">● Backend Connected</p>', unsafe_allow_html=True)
+            ready = requests.get(f"{API_URL}/ready", timeout=5)
+            if ready.status_code == 200:
+                st.markdown('<p class="status-connected">● Backend Connected</p>', unsafe_allow_html=True)
+            else:
+                st.markdown('<p class="status-disconnected">● Backend Warming Up</p>', unsafe_allow_html=True)
+                st.caption("Loading the document index — answers will be available shortly.")
         else:
             st.markdown('<p class="status-disconnected">● Backend Error</p>', unsafe_allow_html=True)
     except requests.exceptions.ConnectionError:
@@ -107,6 +115,15 @@ with st.sidebar:
     # Clear chat button
     if st.button("🗑️ Clear Chat History", use_container_width=True):
         st.session_state.messages = []
+        try:
+            # The backend remembers the conversation too — forget it there as well
+            requests.post(
+                f"{API_URL}/history/clear",
+                params={"session_id": st.session_state.session_id},
+                timeout=10
+            )
+        except Exception:
+            pass
         st.rerun()
         
     # NEW — Clear uploaded documents button
@@ -182,32 +199,54 @@ if uploaded_file is not None:
     already_cleared = uploaded_file.name in st.session_state.cleared_files
 
     if not already_uploaded and not already_cleared:
-        with st.spinner(f"Processing {uploaded_file.name}... This may take 30-60 seconds."):
-            try:
-                files = {"file": (uploaded_file.name, uploaded_file.getvalue(), "application/pdf")}
-                response = requests.post(
-                    f"{API_URL}/upload",
-                    files=files,
-                    params={"session_id": st.session_state.session_id},
-                    timeout=120
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
+        # /upload only queues the PDF (202 + job_id); indexing runs in the
+        # background and we poll /jobs/{job_id} for its progress.
+        try:
+            files = {"file": (uploaded_file.name, uploaded_file.getvalue(), "application/pdf")}
+            response = requests.post(
+                f"{API_URL}/upload",
+                files=files,
+                params={"session_id": st.session_state.session_id},
+                timeout=60
+            )
+
+            if response.status_code == 202:
+                job_id = response.json()["job_id"]
+                progress_bar = st.progress(0.0, text=f"Processing {uploaded_file.name}...")
+                job = {"status": "queued"}
+                deadline = time.time() + UPLOAD_POLL_TIMEOUT
+                while job["status"] not in ("done", "failed"):
+                    if time.time() > deadline:
+                        job = {"status": "failed",
+                               "error": f"Still not indexed after {UPLOAD_POLL_TIMEOUT // 60} minutes"}
+                        break
+                    time.sleep(1)
+                    poll = requests.get(f"{API_URL}/jobs/{job_id}", timeout=10)
+                    if poll.status_code != 200:
+                        job = {"status": "failed", "error": poll.json().get("detail", "Job lost")}
+                        break
+                    job = poll.json()
+                    progress_bar.progress(job["progress"], text=f"{uploaded_file.name}: {job['stage']}")
+                progress_bar.empty()
+
+                if job["status"] == "done":
+                    chunks_added = job["result"]["chunks_added"]
                     st.session_state.uploaded_files.append({
                         "name": uploaded_file.name,
-                        "chunks": result["chunks_added"]
+                        "chunks": chunks_added
                     })
-                    st.success(f"Added! {uploaded_file.name} ({result['chunks_added']} sections indexed)")
+                    st.success(f"Added! {uploaded_file.name} ({chunks_added} sections indexed)")
                 else:
-                    error_detail = response.json().get("detail", "Unknown error")
-                    st.error(f"Upload failed: {error_detail}")
-            except requests.exceptions.ConnectionError:
-                st.error("Backend is offline. Start the FastAPI server first.")
-            except requests.exceptions.Timeout:
-                st.error("Processing timed out. Try a smaller PDF.")
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
+                    st.error(f"Upload failed: {job.get('error') or 'Unknown error'}")
+            else:
+                error_detail = response.json().get("detail", "Unknown error")
+                st.error(f"Upload failed: {error_detail}")
+        except requests.exceptions.ConnectionError:
+            st.error("Backend is offline. Start the FastAPI server first.")
+        except requests.exceptions.Timeout:
+            st.error("The server did not respond in time. Please try again.")
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
 
 if st.session_state.uploaded_files:
     st.markdown("**Active Documents:**")
@@ -247,6 +286,52 @@ def clean_source(source):
     return source_str.strip()
 
 
+# ============================================================
+# HELPER: Read the /ask/stream Server-Sent Events
+# ============================================================
+# The backend sends frames like:
+#   event: token
+#   data: {"text": "Zero"}
+# followed by a blank line. We yield (event, data) pairs as they arrive.
+
+def stream_answer(question):
+    """POST the question to /ask/stream and yield (event, data) pairs."""
+    # `with`: the connection is released even if the caller stops reading early
+    with requests.post(
+        f"{API_URL}/ask/stream",
+        json={"question": question, "session_id": st.session_state.session_id},
+        stream=True,
+        timeout=(5, 120),  # connect fast; allow long gaps on a cold LLM
+    ) as response:
+        if response.status_code != 200:
+            yield "http_error", {"status_code": response.status_code}
+            return
+
+        event, data_lines = "message", []
+        for line in response.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line == "":
+                if data_lines:
+                    yield event, json.loads("\n".join(data_lines))
+                event, data_lines = "message", []
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
+
+
+def render_sources(sources):
+    """Expandable panel listing the retrieved chunks."""
+    with st.expander(f"📄 View {len(sources)} source(s) used"):
+        for i, source in enumerate(sources, 1):
+            clean = clean_source(source)
+            st.markdown(
+                f'<div class="source-chunk"><strong>Source {i}:</strong><br>{clean}</div>',
+                unsafe_allow_html=True,
+            )
+
+
 # ============================================================
 # SESSION STATE — Keeps chat history alive across Streamlit reruns
 # ============================================================
@@ -275,13 +360,7 @@ for message in st.session_state.messages:
         # Show sources if they exist and toggle is on
         if message["role"] == "assistant" and "sources" in message and st.session_state.show_sources:
             if message["sources"]:
-                with st.expander(f"📄 View {len(message['sources'])} source(s) used"):
-                    for i, source in enumerate(message["sources"], 1):
-                        clean = clean_source(source)
-                        st.markdown(
-                            f'<div class="source-chunk"><strong>Source {i}:</strong><br>{clean}</div>',
-                            unsafe_allow_html=True,
-                        )
+                render_sources(message["sources"])
 
 # ============================================================
 # CHAT INPUT & API CALL
@@ -292,65 +371,66 @@ if prompt := st.chat_input("Ask a question about UK employment regulations..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # 2. Call the FastAPI backend and display the response
+    # 2. Call the FastAPI backend and stream the response in
     with st.chat_message("assistant"):
-        with st.spinner("Searching documents and generating answer..."):
-            try:
-                response = requests.post(
-                    f"{API_URL}/ask",
-                    json={"question": prompt},
-                    timeout=120,  # LLM on free tier can be slow (30-60s cold start)
-                )
+        placeholder = st.empty()
+        placeholder.markdown("_Searching documents..._")
+        try:
+            answer = ""
+            sources = []
+            error_msg = None
 
-                if response.status_code == 200:
-                    data = response.json()
-                    answer = data.get("answer", "No answer received.")
+            for event, data in stream_answer(prompt):
+                if event == "sources":
                     sources = data.get("sources", [])
-                    num_chunks = data.get("num_chunks", 0)
-
-                    # Display the answer
-                    st.markdown(answer)
-
-                    # Display sources if toggle is on
-                    if sources and st.session_state.show_sources:
-                        with st.expander(f"📄 View {len(sources)} source(s) used"):
-                            for i, source in enumerate(sources, 1):
-                                clean = clean_source(source)
-                                st.markdown(
-                                    f'<div class="source-chunk"><strong>Source {i}:</strong><br>{clean}</div>',
-                                    unsafe_allow_html=True,
-                                )
-
-                    # Save to session state (including sources for history display)
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": answer,
-                        "sources": sources,
-                    })
-
-                else:
-                    error_msg = f"⚠️ Server returned status code {response.status_code}. Please try again."
-                    st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
-
-            except requests.exceptions.ConnectionError:
-                error_msg = (
-                    "❌ **Cannot connect to the backend server.**\n\n"
-                    "Make sure FastAPI is running:\n"
-                    "```\ncd src && python api.py\n```"
-                )
-                st.error(error_msg)
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
-
-            except requests.exceptions.Timeout:
-                error_msg = (
-                    "⏰ **Request timed out.** The LLM may be experiencing a cold start. "
-                    "This is normal on the free Hugging Face tier — please wait 30 seconds and try again."
-                )
-                st.warning(error_msg)
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
-
-            except Exception as e:
-                error_msg = f"⚠️ Unexpected error: {str(e)}"
+                    placeholder.markdown("_Generating answer..._")
+                elif event == "token":
+                    answer += data.get("text", "")
+                    placeholder.markdown(answer + "▌")
+                elif event == "done":
+                    answer = data.get("answer", answer) or "No answer received."
+                elif event == "error":
+                    answer = data.get("answer", "Unknown error")
+                elif event == "http_error":
+                    error_msg = f"⚠️ Server returned status code {data['status_code']}. Please try again."
+
+            if error_msg:
+                placeholder.empty()
                 st.error(error_msg)
                 st.session_state.messages.append({"role": "assistant", "content": error_msg})
+            else:
+                # Display the final answer (without the typing cursor)
+                placeholder.markdown(answer)
+
+                # Display sources if toggle is on
+                if sources and st.session_state.show_sources:
+                    render_sources(sources)
+
+                # Save to session state (including sources for history display)
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": answer,
+                    "sources": sources,
+                })
+
+        except requests.exceptions.ConnectionError:
+            error_msg = (
+                "❌ **Cannot connect to the backend server.**\n\n"
+                "Make sure FastAPI is running:\n"
+                "```\ncd src && python api.py\n```"
+            )
+            st.error(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
+
+        except requests.exceptions.Timeout:
+            error_msg = (
+                "⏰ **Request timed out.** The LLM may be experiencing a cold start. "
+                "This is normal on the free Hugging Face tier — please wait 30 seconds and try again."
+            )
+            st.warning(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
+
+        except Exception as e:
+            error_msg = f"⚠️ Unexpected error: {str(e)}"
+            st.error(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
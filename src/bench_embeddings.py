@@ -0,0 +1,175 @@
+"""
+Embedding backend benchmark + parity check
+==========================================
+What this does:
+    Embeds the chunks from data/ with every embedding backend
+    (torch, onnx, onnx-int8) and reports, for each one:
+      - document throughput (chunks/sec)
+      - single-query embedding latency (p50 / p95, in ms)
+      - parity with torch: cosine similarity between the two vectors
+        for the same chunk (1.0000 = identical), and top-k overlap — the
+        share of each sample question's top PARITY_TOP_K chunks that the
+        backend retrieves too
+
+How to run (from the project root):
+    python src/bench_embeddings.py
+    python src/bench_embeddings.py --backends torch onnx-int8 --repeats 50
+    python src/bench_embeddings.py --check      # exits 1 if parity is too low
+
+--check fails when a backend's lowest chunk cosine drops below
+PARITY_MIN_COSINE (0.99 for onnx, which should match torch up to float
+rounding; 0.97 for onnx-int8, whose weights are quantised) or its mean
+top-k overlap drops below PARITY_MIN_OVERLAP (0.9). Only switch
+EMBEDDING_BACKEND in production if it passes — otherwise rebuild the
+database with the new backend so queries and chunks are embedded the
+same way.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from embeddings import BACKENDS, get_embeddings
+from pdf_loader import load_all_pdfs
+from chunker import chunk_text
+
+# Parity thresholds for --check (see the docstring)
+PARITY_MIN_COSINE = {"onnx": 0.99, "onnx-int8": 0.97}
+PARITY_MIN_OVERLAP = 0.9
+PARITY_TOP_K = 4
+
+SAMPLE_QUESTIONS = [
+    "What are the changes to zero hours contracts?",
+    "What changes affect sick pay?",
+    "When do the employment rights changes take effect?",
+    "What happens with unfair dismissal?",
+    "What are the plans for flexible working?",
+]
+
+
+def percentile_ms(samples: list, pct: float) -> float:
+    return float(np.percentile(samples, pct) * 1000)
+
+
+def bench_backend(backend: str, texts: list, repeats: int) -> dict:
+    started = time.perf_counter()
+    # Time the model itself, not the query-embedding cache in front of it
+    embeddings = get_embeddings(backend=backend)
+    embeddings = getattr(embeddings, "wrapped", embeddings)
+    load_seconds = time.perf_counter() - started
+
+    # Warm-up call so one-off allocation cost isn't counted
+    embeddings.embed_query(SAMPLE_QUESTIONS[0])
+
+    started = time.perf_counter()
+    doc_vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+    doc_seconds = time.perf_counter() - started
+
+    query_vectors = np.array([embeddings.embed_query(q) for q in SAMPLE_QUESTIONS], dtype=np.float32)
+
+    query_times = []
+    for i in range(repeats):
+        question = SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)]
+        started = time.perf_counter()
+        embeddings.embed_query(question)
+        query_times.append(time.perf_counter() - started)
+
+    return {
+        "backend": backend,
+        "load_s": load_seconds,
+        "chunks_per_s": len(texts) / doc_seconds,
+        "query_p50_ms": percentile_ms(query_times, 50),
+        "query_p95_ms": percentile_ms(query_times, 95),
+        "vectors": doc_vectors,
+        "query_vectors": query_vectors,
+    }
+
+
+def top_k_overlap(result: dict, reference: dict, k: int = PARITY_TOP_K) -> float:
+    """
+    Mean share of the reference's top-k chunks (per sample question) that
+    the other backend also puts in its top k — each side searching its own
+    vectors, as a database built with that backend would.
+    """
+    k = min(k, len(reference["vectors"]))
+    overlaps = []
+    for query, reference_query in zip(result["query_vectors"], reference["query_vectors"]):
+        ours = set(np.argsort(-(result["vectors"] @ query))[:k])
+        theirs = set(np.argsort(-(reference["vectors"] @ reference_query))[:k])
+        overlaps.append(len(ours & theirs) / k)
+    return float(np.mean(overlaps))
+
+
+def parity_failures(result: dict, reference: dict) -> list:
+    """Threshold violations of one backend against the torch reference (empty = passes)."""
+    failures = []
+    # Vectors are L2-normalised, so the row-wise dot product is the cosine
+    cos_min = float((result["vectors"] * reference["vectors"]).sum(axis=1).min())
+    min_cosine = PARITY_MIN_COSINE.get(result["backend"], 1.0)
+    if cos_min < min_cosine:
+        failures.append(f"min cosine {cos_min:.4f} < {min_cosine}")
+    overlap = top_k_overlap(result, reference)
+    if overlap < PARITY_MIN_OVERLAP:
+        failures.append(f"top-{PARITY_TOP_K} overlap {overlap:.2f} < {PARITY_MIN_OVERLAP}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--repeats", type=int, default=30, help="Query embeddings to time per backend")
+    parser.add_argument("--data", default="data", help="Folder with PDFs to chunk")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit with status 1 if a backend misses the parity thresholds")
+    args = parser.parse_args()
+    if args.check and "torch" not in args.backends:
+        parser.error("--check compares against torch: include it in --backends")
+
+    print("Loading and chunking PDFs...")
+    texts = [c.page_content for c in chunk_text(load_all_pdfs(args.data))]
+    print(f"  {len(texts)} chunks\n")
+
+    results = []
+    for backend in args.backends:
+        print(f"Benchmarking {backend}...")
+        results.append(bench_backend(backend, texts, args.repeats))
+
+    reference = next((r for r in results if r["backend"] == "torch"), None)
+
+    print()
+    print("=" * 88)
+    print(f"{'backend':<11}{'load s':>8}{'chunks/s':>11}{'query p50':>12}{'query p95':>12}"
+          f"{'cos min':>11}{'cos mean':>11}{'top-k':>8}")
+    print("-" * 88)
+    for r in results:
+        if reference is not None:
+            # Vectors are L2-normalised, so the row-wise dot product is the cosine
+            cosines = (r["vectors"] * reference["vectors"]).sum(axis=1)
+            cos_min, cos_mean = f"{cosines.min():.4f}", f"{cosines.mean():.4f}"
+            overlap = f"{top_k_overlap(r, reference):.2f}"
+        else:
+            cos_min = cos_mean = overlap = "n/a"
+        print(f"{r['backend']:<11}{r['load_s']:>8.1f}{r['chunks_per_s']:>11.1f}"
+              f"{r['query_p50_ms']:>10.1f}ms{r['query_p95_ms']:>10.1f}ms{cos_min:>11}{cos_mean:>11}{overlap:>8}")
+    print("=" * 88)
+    if reference is None:
+        print("(Include 'torch' in --backends to get parity numbers.)")
+
+    if args.check:
+        failed = False
+        for r in results:
+            if r is reference:
+                continue
+            failures = parity_failures(r, reference)
+            failed = failed or bool(failures)
+            print(f"{'❌' if failures else '✅'} {r['backend']}: {'; '.join(failures) or 'parity OK'}")
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Retrieval engine benchmark
+==========================
+What this does:
+    Times top-k search through Chroma against the in-memory NumPy index
+    (numpy_index.py) on the built database, and reports p50 / p99 latency
+    per engine plus how often both engines return the same chunks.
+    BM25 alone and NumPy + BM25 fused with RRF (lexical_index.py) are
+    timed too, so the cost hybrid search adds is visible.
+
+    Question vectors are embedded once up front, so the numbers measure
+    the search alone, not the embedding model.
+
+    --recall adds a quantisation report: for float32 / float16 / int8
+    storage (see numpy_index.py) it shows matrix size, latency and
+    recall@k against exact float32 search — both for the quantised scores
+    alone and with float32 re-scoring of the top candidates. Each storage
+    type is written as a temporary export and memory-mapped, exactly as
+    the API serves it.
+
+How to run (from the project root, after python src/build_db.py):
+    python src/bench_retrieval.py
+    python src/bench_retrieval.py --repeats 500 --k 4
+    python src/bench_retrieval.py --recall --questions my_questions.txt
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from langchain_chroma import Chroma
+
+from bench_embeddings import SAMPLE_QUESTIONS
+from numpy_index import DTYPES, NumpyVectorIndex, export_index, read_collection
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from vectorstore import CHROMA_DB_DIR, get_embedding_function
+
+
+def percentile_ms(samples: list, pct: float) -> float:
+    return float(np.percentile(samples, pct) * 1000)
+
+
+def time_engine(search, inputs: list, repeats: int) -> list:
+    search(inputs[0])  # warm-up
+    timings = []
+    for i in range(repeats):
+        started = time.perf_counter()
+        search(inputs[i % len(inputs)])
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def recall_at_k(results: list, exact: list) -> float:
+    """Share of the exact top-k chunk ids that the approximate search also returned."""
+    found = sum(len({d.id for d in got} & {d.id for d in want}) for got, want in zip(results, exact))
+    return found / max(sum(len(want) for want in exact), 1)
+
+
+def recall_report(collection, vectors: list, k: int, repeats: int, candidates: int):
+    ids, matrix, texts, metadatas = read_collection(collection)
+    exact = NumpyVectorIndex(ids, matrix, texts, metadatas).search_batch(vectors, k)
+
+    print()
+    print("=" * 70)
+    print(f"{'storage':<10}{'MB':>8}{'p50':>11}{'recall@' + str(k):>12}"
+          f"{'+rescore p50':>15}{'recall@' + str(k):>12}")
+    print("-" * 70)
+    scratch = tempfile.mkdtemp(prefix="vector_index_")
+    for dtype in DTYPES:
+        path = export_index(ids, matrix, texts, metadatas, dtype=dtype, root=scratch, rescore=True)
+        index = NumpyVectorIndex.from_mapped(path)
+        megabytes = (index.vectors.nbytes + (index.scales.nbytes if index.scales is not None else 0)) / 1e6
+
+        index.rescore_candidates = 0
+        approx_recall = recall_at_k(index.search_batch(vectors, k), exact)
+        approx_p50 = percentile_ms(time_engine(lambda v: index.search(v, k), vectors, repeats), 50)
+
+        if dtype == "float32":
+            print(f"{dtype:<10}{megabytes:>8.2f}{approx_p50:>9.3f}ms{approx_recall:>12.3f}{'—':>15}{'—':>12}")
+            continue
+        index.rescore_candidates = candidates
+        rescored_recall = recall_at_k(index.search_batch(vectors, k), exact)
+        rescored_p50 = percentile_ms(time_engine(lambda v: index.search(v, k), vectors, repeats), 50)
+        print(f"{dtype:<10}{megabytes:>8.2f}{approx_p50:>9.3f}ms{approx_recall:>12.3f}"
+              f"{rescored_p50:>13.3f}ms{rescored_recall:>12.3f}")
+    shutil.rmtree(scratch, ignore_errors=True)
+    print("=" * 70)
+    print(f"{len(ids)} chunks, {len(vectors)} questions, re-scoring the top {candidates} candidates")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Chroma and NumPy retrieval latency.")
+    parser.add_argument("--repeats", type=int, default=200, help="Searches to time per engine")
+    parser.add_argument("--k", type=int, default=4, help="Chunks per search")
+    parser.add_argument("--recall", action="store_true",
+                        help="Also report recall@k of float16 / int8 storage against float32")
+    parser.add_argument("--questions", help="Text file with one question per line (default: built-in samples)")
+    parser.add_argument("--candidates", type=int, default=32, help="Candidates re-scored in float32")
+    args = parser.parse_args()
+
+    questions = SAMPLE_QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    embedding_function = get_embedding_function()
+    vectorstore = Chroma(persist_directory=CHROMA_DB_DIR, embedding_function=embedding_function)
+
+    started = time.perf_counter()
+    index = NumpyVectorIndex.from_collection(vectorstore._collection)
+    print(f"NumPy index: {len(index)} chunks loaded in {time.perf_counter() - started:.2f}s")
+
+    vectors = [embedding_function.embed_query(q) for q in questions]
+
+    lexical = LexicalIndex.load()
+    if lexical is None:
+        lexical = LexicalIndex()
+        rows = vectorstore._collection.get(include=["documents", "metadatas"])
+        lexical.add(rows["ids"], rows["documents"], rows["metadatas"])
+
+    def hybrid(pair):
+        question, vector = pair
+        return reciprocal_rank_fusion(
+            [index.search(vector, k=20), lexical.search(question, 20)], [1.0, 1.0], args.k
+        )
+
+    # Every engine gets (question, vector) pairs
+    engines = {
+        "chroma": lambda p: vectorstore.similarity_search_by_vector(p[1], k=args.k),
+        "numpy": lambda p: index.search(p[1], k=args.k),
+        "bm25": lambda p: lexical.search(p[0], args.k),
+        "hybrid": hybrid,
+    }
+    pairs = list(zip(questions, vectors))
+
+    same = sum(
+        [d.id for d in engines["chroma"](p)] == [d.id for d in engines["numpy"](p)]
+        for p in pairs
+    )
+
+    print()
+    print("=" * 44)
+    print(f"{'engine':<10}{'p50':>10}{'p99':>10}{'mean':>12}")
+    print("-" * 44)
+    for name, search in engines.items():
+        timings = time_engine(search, pairs, args.repeats)
+        print(f"{name:<10}{percentile_ms(timings, 50):>8.3f}ms{percentile_ms(timings, 99):>8.3f}ms"
+              f"{np.mean(timings) * 1000:>10.3f}ms")
+    print("=" * 44)
+    print(f"Identical top-{args.k} (chroma vs numpy): {same}/{len(vectors)} questions")
+    print("hybrid = numpy top-20 + bm25 top-20 fused with RRF")
+
+    if args.recall:
+        recall_report(vectorstore._collection, vectors, args.k, args.repeats, args.candidates)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,405 @@
 """
 Phase 5: Pre-populate ChromaDB during Docker build.
 This runs once during 'docker build' so the container starts ready to serve queries.
+
+The build is a staged pipeline:
+    extract → chunk → embed (in batches) → insert (in batches)
+(extract and chunk are interleaved: pages stream from the PDF workers straight
+into the chunker, see pdf_loader.iter_pdf_pages_parallel / chunker.chunk_pages)
+Each stage is timed and reports its throughput, so large corpora can be
+rebuilt predictably. Tune with:
+    --embed-batch-size / BUILD_EMBED_BATCH_SIZE    chunks per model call (default 64)
+    --insert-batch-size / BUILD_INSERT_BATCH_SIZE  chunks per Chroma write (default 512)
+    --threads / EMBEDDING_THREADS                  intra-op threads for the embedding model
+    --workers / PDF_WORKERS                        PDF extraction processes (0 = one per core)
+
+Builds are incremental. A manifest (chroma_db/build_manifest.json) stores a
+content hash per PDF and per chunk:
+    - unchanged PDFs are not even opened,
+    - a changed PDF is re-chunked, and only chunks whose text is new get
+      embedded and upserted; chunks whose text is unchanged but whose
+      metadata moved (page, offsets) only get their metadata updated;
+      its chunks that disappeared are deleted,
+    - a PDF removed from data/ has all its chunks deleted.
+Pass --full to throw the database away and rebuild everything.
+
+After every build the base corpus is also exported for the query service:
+    - chroma_db/vector_index/ (see numpy_index.py) for the memory-mapped
+      numpy retrieval engine,
+      --vector-dtype / VECTOR_STORE_DTYPE          float32 (default), float16 or int8
+    - chroma_db/lexical_index.json (see lexical_index.py), the BM25 index
+      used by hybrid search.
 """
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from pdf_loader import load_all_pdfs
-from chunker import chunk_text
-from vectorstore import create_vectorstore
+import argparse
+import hashlib
+import json
+import shutil
+import time
+
+from pdf_loader import iter_pdf_pages_parallel, PDF_WORKERS
+from chunker import chunk_pages
+from vectorstore import CHROMA_DB_DIR, get_embedding_function
+from corpus_version import bump_corpus_version, corpus_write_lock, new_corpus_version
+from numpy_index import (DTYPES, VECTOR_RESCORE_CANDIDATES, VECTOR_STORE_DTYPE, current_export,
+                         export_index, read_collection)
+from lexical_index import LEXICAL_INDEX_PATH, LexicalIndex
+from settings import PROJECT_ROOT
+import embeddings
+
+EMBED_BATCH_SIZE = int(os.getenv("BUILD_EMBED_BATCH_SIZE", "64"))
+INSERT_BATCH_SIZE = int(os.getenv("BUILD_INSERT_BATCH_SIZE", "512"))
+
+MANIFEST_PATH = os.path.join(CHROMA_DB_DIR, "build_manifest.json")
+MANIFEST_VERSION = 4  # 2: page-streamed chunking, 3: page-range + offset metadata, 4: text/metadata hashes
+
+# If any of these change, every stored vector is stale → full rebuild.
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+class StageTimer:
+    """Collects wall time and item counts per pipeline stage."""
+
+    def __init__(self):
+        self.stages = {}  # name -> [seconds, items, unit]
+
+    def add(self, name: str, seconds: float, items: int, unit: str):
+        stage = self.stages.setdefault(name, [0.0, 0, unit])
+        stage[0] += seconds
+        stage[1] += items
+
+    def report(self):
+        print()
+        print("-" * 60)
+        print(f"{'stage':<14}{'time':>10}{'items':>12}{'throughput':>24}")
+        print("-" * 60)
+        total = 0.0
+        for name, (seconds, items, unit) in self.stages.items():
+            total += seconds
+            rate = items / seconds if seconds > 0 else float("inf")
+            print(f"{name:<14}{seconds:>9.2f}s{items:>12,}{rate:>17,.1f} {unit}/s")
+        print("-" * 60)
+        print(f"{'total':<14}{total:>9.2f}s")
+
+
+def batched(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# ============================================================
+# MANIFEST
+# ============================================================
+
+def build_settings() -> dict:
+    """Everything that decides what a stored vector looks like."""
+    return {
+        "embedding_model": embeddings.EMBEDDING_MODEL,
+        "embedding_backend": embeddings.EMBEDDING_BACKEND,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+
+def load_manifest() -> dict:
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("settings") != build_settings():
+        return None
+    return manifest
+
+
+def save_manifest(files: dict):
+    manifest = {"version": MANIFEST_VERSION, "settings": build_settings(), "files": files}
+    # Write-then-rename so a crash mid-write can't leave a half-written manifest
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_data_dir(data_dir: str) -> dict:
+    """{filename: sha256} for every PDF in data/."""
+    if not os.path.exists(data_dir):
+        raise FileNotFoundError(f"ERROR: The '{data_dir}' folder does not exist.")
+    hashes = {}
+    for filename in sorted(os.listdir(data_dir)):
+        if filename.lower().endswith(".pdf"):
+            hashes[filename] = file_sha256(os.path.join(data_dir, filename))
+    if not hashes:
+        raise FileNotFoundError(f"ERROR: No PDF files found in the '{data_dir}' folder.")
+    return hashes
+
+
+def chunk_ids_and_hashes(filename: str, chunks: list) -> list:
+    """
+    Stable (id, [text hash, metadata hash]) per chunk.
+
+    The id is derived from the file name + chunk text, so an unchanged
+    paragraph keeps its id when text elsewhere in the PDF changes.
+    The two hashes are kept apart: only a new text hash needs a new
+    vector. An edit near the start of a PDF shifts the offsets (and maybe
+    pages) of every later chunk — those only get their metadata rewritten.
+    """
+    seen = {}
+    result = []
+    for chunk in chunks:
+        base_id = hashlib.sha256(f"{filename}\0{chunk.page_content}".encode("utf-8")).hexdigest()[:32]
+        # Identical text twice in one file (headers, footers) → suffix the repeats
+        seen[base_id] = seen.get(base_id, 0) + 1
+        chunk_id = base_id if seen[base_id] == 1 else f"{base_id}-{seen[base_id]}"
+        text_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+        meta_hash = hashlib.sha256(json.dumps(chunk.metadata, sort_keys=True).encode("utf-8")).hexdigest()
+        result.append((chunk_id, [text_hash, meta_hash]))
+    return result
+
+
+# ============================================================
+# BUILD
+# ============================================================
 
-def build():
+def export_indexes(collection, dtype: str, timer: StageTimer) -> str:
+    """
+    Writes the base corpus (uploads excluded) as the mmap-able vector index
+    and the BM25 index. Returns the corpus version they were written for:
+    the caller bumps to exactly that, so a server seeing it knows nothing
+    was uploaded since and can serve from the exports without opening Chroma.
+    """
+    version = new_corpus_version()
+    started = time.perf_counter()
+    ids, vectors, texts, metadatas = read_collection(collection)
+    base = [i for i, m in enumerate(metadatas) if (m or {}).get("uploaded") != "true"]
+    ids = [ids[i] for i in base]
+    texts = [texts[i] for i in base]
+    metadatas = [metadatas[i] for i in base]
+
+    path = export_index(
+        ids, vectors[base], texts, metadatas,
+        dtype=dtype,
+        info={
+            "embedding_model": embeddings.EMBEDDING_MODEL,
+            "embedding_backend": embeddings.EMBEDDING_BACKEND,
+            "corpus_version": version,
+        },
+    )
+    timer.add("export", time.perf_counter() - started, len(base), "chunks")
+    print(f"Vector index exported ({dtype}) to {path}")
+
+    started = time.perf_counter()
+    lexical = LexicalIndex()
+    lexical.add(ids, texts, metadatas)
+    lexical.save()
+    timer.add("bm25", time.perf_counter() - started, len(base), "chunks")
+    print(f"BM25 index written to {LEXICAL_INDEX_PATH} ({len(lexical.postings):,} terms)")
+    return version
+
+
+def exports_are_current(dtype: str) -> bool:
+    export = current_export()
+    wants_exact = dtype != "float32" and VECTOR_RESCORE_CANDIDATES > 0
+    return (export is not None and export[1].get("dtype") == dtype
+            and export[1].get("exact", dtype != "float32") == wants_exact
+            and export[1].get("embedding_model") == embeddings.EMBEDDING_MODEL
+            and export[1].get("embedding_backend") == embeddings.EMBEDDING_BACKEND
+            and LexicalIndex.load() is not None)
+
+
+def build(embed_batch_size: int = EMBED_BATCH_SIZE, insert_batch_size: int = INSERT_BATCH_SIZE,
+          threads: int = 0, full: bool = False, workers: int = PDF_WORKERS,
+          vector_dtype: str = VECTOR_STORE_DTYPE):
+    # A running API may be ingesting an upload: one writer at a time
+    with corpus_write_lock():
+        return _build(embed_batch_size, insert_batch_size, threads, full, workers, vector_dtype)
+
+
+def _build(embed_batch_size: int, insert_batch_size: int, threads: int, full: bool, workers: int,
+           vector_dtype: str):
     # Resolve the data/ folder relative to the project root
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    data_dir = os.path.join(project_root, "data")
+    data_dir = os.path.join(PROJECT_ROOT, "data")
+    timer = StageTimer()
+
+    print(f"Scanning PDFs in {data_dir}...")
+    started = time.perf_counter()
+    file_hashes = scan_data_dir(data_dir)
+    timer.add("scan", time.perf_counter() - started, len(file_hashes), "files")
+
+    manifest = None if full else load_manifest()
+    if manifest is None:
+        if os.path.exists(CHROMA_DB_DIR):
+            reason = "--full requested" if full else "no usable manifest (missing, or build settings changed)"
+            print(f"Full rebuild: {reason}. Deleting old database at '{CHROMA_DB_DIR}/'...")
+            shutil.rmtree(CHROMA_DB_DIR)
+        old_files = {}
+    else:
+        old_files = manifest["files"]
+
+    changed = [f for f, h in file_hashes.items() if old_files.get(f, {}).get("sha256") != h]
+    removed = [f for f in old_files if f not in file_hashes]
+    print(f"{len(file_hashes)} PDF(s): {len(changed)} new/changed, {len(removed)} removed, "
+          f"{len(file_hashes) - len(changed)} unchanged")
+
+    if manifest is not None and not changed and not removed:
+        if exports_are_current(vector_dtype):
+            print("Database is up to date — nothing to do.")
+            return timer
+        print("Database is up to date — only the exported indexes need writing.")
+        from langchain_chroma import Chroma
+        collection = Chroma(persist_directory=CHROMA_DB_DIR)._collection
+        version = export_indexes(collection, vector_dtype, timer)
+        bump_corpus_version(version)  # running servers pick up the new export
+        timer.report()
+        return timer
+
+    if threads:
+        embeddings.EMBEDDING_THREADS = threads  # picked up when the model loads
+    started = time.perf_counter()
+    embedding_function = get_embedding_function()
+    timer.add("load", time.perf_counter() - started, 1, "models")
+
+    from langchain_chroma import Chroma
+    vectorstore = Chroma(persist_directory=CHROMA_DB_DIR, embedding_function=embedding_function)
+    collection = vectorstore._collection
+
+    # Chroma rejects writes above its own per-call limit
+    max_batch = vectorstore._client.get_max_batch_size()
+    if insert_batch_size > max_batch:
+        print(f"Insert batch size capped at Chroma's limit of {max_batch}")
+        insert_batch_size = max_batch
+
+    new_files = {f: old_files[f] for f in file_hashes if f not in changed}
+    to_embed = []      # (chunk_id, Document) needing a fresh vector
+    to_relabel = []    # (chunk_id, Document) with the same text but new metadata
+    to_delete = []     # chunk ids that no longer exist
+
+    for filename in removed:
+        to_delete.extend(old_files[filename]["chunks"])
+
+    # Stages 1 + 2: extract pages across a process pool and chunk them as they
+    # stream in (file by file, in order) — the two stages are interleaved,
+    # so they are timed together.
+    started = time.perf_counter()
+    pages = iter_pdf_pages_parallel([os.path.join(data_dir, f) for f in changed], workers=workers)
+    chunks_by_file = {filename: [] for filename in changed}
+    for chunk in chunk_pages(pages, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+        chunks_by_file[chunk.metadata["source"]].append(chunk)
+    timer.add("extract+chunk", time.perf_counter() - started,
+              sum(len(c) for c in chunks_by_file.values()), "chunks")
+
+    for filename, chunks in chunks_by_file.items():
+        old_chunks = old_files.get(filename, {}).get("chunks", {})
+        new_chunks = {}
+        for chunk, (chunk_id, hashes) in zip(chunks, chunk_ids_and_hashes(filename, chunks)):
+            new_chunks[chunk_id] = hashes
+            old_hashes = old_chunks.get(chunk_id)
+            if old_hashes is None or old_hashes[0] != hashes[0]:
+                to_embed.append((chunk_id, chunk))
+            elif old_hashes[1] != hashes[1]:
+                to_relabel.append((chunk_id, chunk))
+        to_delete.extend(cid for cid in old_chunks if cid not in new_chunks)
+
+        new_files[filename] = {"sha256": file_hashes[filename], "chunks": new_chunks}
+        print(f"  {filename}: {len(chunks)} chunks, {sum(1 for c in new_chunks if c not in old_chunks)} new")
+
+    # Deletes first, so a chunk id can't be deleted right after being re-added
+    if to_delete:
+        started = time.perf_counter()
+        for batch in batched(to_delete, insert_batch_size):
+            collection.delete(ids=batch)
+        timer.add("delete", time.perf_counter() - started, len(to_delete), "chunks")
+
+    # Same text, new metadata (shifted offsets/pages): keep the vector
+    if to_relabel:
+        started = time.perf_counter()
+        for batch in batched(to_relabel, insert_batch_size):
+            collection.update(
+                ids=[chunk_id for chunk_id, _ in batch],
+                metadatas=[chunk.metadata for _, chunk in batch],
+            )
+        timer.add("relabel", time.perf_counter() - started, len(to_relabel), "chunks")
+
+    # Stages 3 + 4: embed in batches, upsert whenever a full insert batch is ready.
+    # Only one insert batch of vectors is held in memory at a time.
+    pending = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+
+    def flush():
+        if not pending["ids"]:
+            return
+        started = time.perf_counter()
+        collection.upsert(
+            ids=pending["ids"],
+            embeddings=pending["embeddings"],
+            documents=pending["documents"],
+            metadatas=pending["metadatas"],
+        )
+        timer.add("insert", time.perf_counter() - started, len(pending["ids"]), "chunks")
+        for values in pending.values():
+            values.clear()
+
+    done = 0
+    for batch in batched(to_embed, embed_batch_size):
+        texts = [chunk.page_content for _, chunk in batch]
+        started = time.perf_counter()
+        vectors = embedding_function.embed_documents(texts)
+        timer.add("embed", time.perf_counter() - started, len(batch), "chunks")
+
+        pending["ids"].extend(chunk_id for chunk_id, _ in batch)
+        pending["embeddings"].extend(vectors)
+        pending["documents"].extend(texts)
+        pending["metadatas"].extend(chunk.metadata for _, chunk in batch)
+        if len(pending["ids"]) >= insert_batch_size:
+            flush()
+
+        done += len(batch)
+        print(f"  Embedded {done}/{len(to_embed)} chunks", end="\r")
+    flush()
+    print()
+
+    # Only record the new state once every write has gone through.
+    # The exports are re-read from Chroma, so the vector and BM25 indexes
+    # carry the relabelled metadata too (page filters stay right).
+    save_manifest(new_files)
+    version = export_indexes(collection, vector_dtype, timer)
+    bump_corpus_version(version)  # invalidates answers cached against the old corpus
+
+    print(f"ChromaDB updated: {len(to_embed)} upserted, {len(to_relabel)} metadata-only, "
+          f"{len(to_delete)} deleted, "
+          f"{collection.count()} chunks total")
+    timer.report()
+    return timer
 
-    print(f"Loading PDFs from {data_dir}...")
-    text = load_all_pdfs(data_dir)
-    print(f"Loaded {len(text):,} characters")
 
-    chunks = chunk_text(text)
-    print(f"Created {len(chunks)} chunks")
+def main():
+    parser = argparse.ArgumentParser(description="Build the ChromaDB vector database from data/.")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="Chunks per embedding model call")
+    parser.add_argument("--insert-batch-size", type=int, default=INSERT_BATCH_SIZE,
+                        help="Chunks per ChromaDB write")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Intra-op threads for the embedding model (0 = library default)")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the manifest: delete the database and rebuild everything")
+    parser.add_argument("--workers", type=int, default=PDF_WORKERS,
+                        help="PDF extraction processes (0 = one per CPU core)")
+    parser.add_argument("--vector-dtype", default=VECTOR_STORE_DTYPE, choices=DTYPES,
+                        help="Storage type of the exported vector index")
+    args = parser.parse_args()
+    build(args.embed_batch_size, args.insert_batch_size, args.threads, args.full, args.workers,
+          args.vector_dtype)
 
-    create_vectorstore(chunks, force_rebuild=True)
-    print("ChromaDB populated successfully!")
 
 if __name__ == "__main__":
-    build()
\ No newline at end of file
+    main()
@@ -11,6 +11,7 @@ Why chunk?
 """
 
 # from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from pdf_loader import load_all_pdfs  # Import our Script 1
 import sys
@@ -51,6 +52,107 @@ def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> l
     return chunks
 
 
+def chunk_pages(pages, chunk_size: int = 1000, chunk_overlap: int = 200):
+    """
+    Streaming version of chunk_text() for page records.
+
+    Args:
+        pages: Iterable of (source, page_number, text) — e.g. from
+               pdf_loader.iter_pdf_pages(). Consumed lazily.
+        chunk_size / chunk_overlap: Same meaning as in chunk_text()
+
+    Yields:
+        LangChain Document objects with metadata:
+            source      — file the chunk came from
+            page_start  — first page the chunk covers (1-based)
+            page_end    — last page the chunk covers
+            page        — display form: "4" or "4-5"
+            char_start  — offset of the chunk's first character in the document
+            char_end    — offset just past its last character
+        Numbers stay ints so the vector store can filter on ranges
+        (e.g. page_start <= 10 AND page_end >= 5).
+
+    How it stays memory-bounded:
+        Pages are appended to a small rolling buffer. Once the buffer holds a
+        few chunks' worth of text it is split, every chunk except the LAST is
+        emitted, and the buffer restarts at the last chunk — which then gets
+        re-split together with the following pages. Chunks still flow across
+        page boundaries (and keep their overlap), but no more than ~4 chunks
+        plus one page of text is ever held at once.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", ". ", " ", ""],
+        add_start_index=True,  # where each chunk starts inside the buffer
+    )
+    window = chunk_size * 4
+
+    source = None
+    buffer = ""
+    buffer_offset = 0   # position of buffer[0] within the whole document
+    page_starts = []    # (document offset, page number) of pages in the buffer
+
+    def page_at(offset: int) -> int:
+        page = page_starts[0][1]
+        for start, number in page_starts:
+            if start > offset:
+                break
+            page = number
+        return page
+
+    def chunk_metadata(char_start: int, length: int) -> dict:
+        char_end = char_start + length
+        page_start = page_at(char_start)
+        page_end = page_at(char_end - 1)
+        return {
+            "source": source,
+            "page_start": page_start,
+            "page_end": page_end,
+            "page": str(page_start) if page_start == page_end else f"{page_start}-{page_end}",
+            "char_start": char_start,
+            "char_end": char_end,
+        }
+
+    def split(final: bool):
+        nonlocal buffer, buffer_offset, page_starts
+        docs = splitter.create_documents([buffer])
+        keep = docs if final else docs[:-1]
+        for doc in keep:
+            start = buffer_offset + doc.metadata["start_index"]
+            yield Document(
+                page_content=doc.page_content,
+                metadata=chunk_metadata(start, len(doc.page_content)),
+            )
+        if final or not keep:
+            if final:
+                buffer, page_starts = "", []
+            return
+        # Restart the buffer at the last (un-emitted) chunk
+        cut = docs[-1].metadata["start_index"]
+        buffer = buffer[cut:]
+        buffer_offset += cut
+        # Drop pages that end before the new buffer start (keep the one it starts in)
+        while len(page_starts) > 1 and page_starts[1][0] <= buffer_offset:
+            page_starts.pop(0)
+
+    for page_source, page_number, text in pages:
+        if page_source != source:
+            if buffer:
+                yield from split(final=True)
+            source, buffer, buffer_offset, page_starts = page_source, "", 0, []
+
+        page_starts.append((buffer_offset + len(buffer), page_number))
+        buffer += text + "\n"  # Add a newline between pages
+
+        if len(buffer) >= window:
+            yield from split(final=False)
+
+    if buffer:
+        yield from split(final=True)
+
+
 # =============================================================
 # TEST: Run this script directly to see  chunks
 # =============================================================
@@ -0,0 +1,203 @@
+"""
+Bounded thread-pool executor for blocking RAG work.
+====================================================
+What this does:
+    FastAPI runs our endpoints on a single asyncio event loop. Anything
+    blocking (Chroma queries, PDF parsing, synchronous LLM calls) stalls
+    EVERY request on that worker, including /health.
+
+    BoundedExecutor runs that work on a fixed-size thread pool and admits
+    at most max_workers + max_queue jobs at once. Anything beyond that is
+    rejected immediately with ExecutorSaturated, which the API turns into
+    a 503 with a Retry-After header instead of letting requests pile up.
+
+Configuration (environment variables):
+    RAG_MAX_CONCURRENCY  — threads running RAG jobs in parallel (default 8)
+    RAG_MAX_QUEUE        — extra jobs allowed to wait for a thread (default 32)
+    RAG_RETRY_AFTER      — seconds suggested to rejected clients (default 5)
+    LLM_MAX_CONCURRENCY  — LLM calls in flight at once (default 64)
+    LLM_MAX_QUEUE        — extra LLM calls allowed to wait (default 256)
+
+AsyncLimiter is the same idea for work that is already async (the LLM
+calls through AsyncInferenceClient): no threads, just admission control
+plus a semaphore, so hundreds of generations can overlap on one loop.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+RAG_MAX_CONCURRENCY = int(os.getenv("RAG_MAX_CONCURRENCY", "8"))
+RAG_MAX_QUEUE = int(os.getenv("RAG_MAX_QUEUE", "32"))
+RAG_RETRY_AFTER = int(os.getenv("RAG_RETRY_AFTER", "5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+
+
+class ExecutorSaturated(Exception):
+    """Raised when an executor is already holding as many jobs as it admits."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"'{name}' executor is at capacity. Retry in {retry_after}s.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    A thread pool with admission control.
+
+    Args:
+        name: Label used in thread names, errors and stats
+        max_workers: How many jobs run at the same time
+        max_queue: How many further jobs may wait for a free thread
+        retry_after: Seconds to suggest to callers that get rejected
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int = RAG_RETRY_AFTER):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._admitted = 0   # running + queued
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _try_admit(self) -> bool:
+        with self._lock:
+            if self._admitted >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                return False
+            self._admitted += 1
+            return True
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._admitted -= 1
+            self._completed += 1
+
+    def _run_job(self, fn):
+        with self._lock:
+            self._running += 1
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedules fn(*args, **kwargs) and returns its concurrent.futures.Future.
+        For synchronous callers that want to wait with a timeout.
+
+        TRAP AVOIDED: the admission slot is released when the THREAD finishes,
+        not when the caller stops waiting. If the caller gives up (timeout,
+        cancelled coroutine), the thread keeps running — releasing early
+        would let more work in than we have threads for.
+        """
+        if not self._try_admit():
+            raise ExecutorSaturated(self.name, self.retry_after)
+
+        job = functools.partial(fn, *args, **kwargs)
+        try:
+            future = self._pool.submit(self._run_job, job)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the pool and awaits its result (see submit)."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        """Snapshot of the executor's load, for /health and debugging."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._admitted - self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncLimiter:
+    """
+    Admission control + concurrency cap for coroutines.
+
+    Usage:
+        async with limiter.slot():
+            await some_network_call()
+
+    Raises ExecutorSaturated straight away when max_concurrency + max_queue
+    callers already hold or wait for a slot.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, retry_after: int = RAG_RETRY_AFTER):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+
+        # asyncio.Semaphore binds to the first loop that waits on it, and the
+        # terminal chat loop and uvicorn each run their own loop — keep one per loop.
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        with self._lock:
+            if self._admitted >= self.max_concurrency + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(self.name, self.retry_after)
+            self._admitted += 1
+        try:
+            async with self._semaphore():
+                with self._lock:
+                    self._running += 1
+                try:
+                    yield
+                finally:
+                    with self._lock:
+                        self._running -= 1
+        finally:
+            with self._lock:
+                self._admitted -= 1
+                self._completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._admitted - self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
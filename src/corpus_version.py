@@ -0,0 +1,120 @@
+"""
+Corpus version stamp
+====================
+What this does:
+    Anything cached from the document collection (answers, in-memory
+    indexes) is only valid for the exact set of chunks it was built from.
+    This module keeps a small stamp file next to ChromaDB that changes
+    every time the collection does:
+      - build_db.py finishing a build,
+      - a PDF upload (rag_chain.ingest_pdf_bytes),
+      - a cleanup of uploaded chunks.
+
+    The stamp is a random token, not a counter: a full rebuild deletes
+    chroma_db/ (and the stamp with it), and a counter restarting at 0
+    would make old cache entries look valid again.
+
+    Because it lives on disk, every process (API workers, build script)
+    sees the same version. Readers cache it keyed on the file's inode,
+    mtime and size: every bump is an os.replace(), which always makes a
+    new inode, so two bumps within one mtime tick are still told apart.
+    Only bumps write the file; until the first one (build_db.py), the
+    version is MISSING_VERSION.
+
+Writers:
+    ChromaDB's local persistent mode is not safe for several processes
+    writing at once, and a version read at the start of a write must
+    still be current when the write bumps it. So every writer (build_db,
+    upload, cleanup — in any worker) holds corpus_write_lock(), an
+    exclusive fcntl.flock on chroma_db.lock, from reading the version
+    until after its bump. The lock file sits NEXT TO chroma_db/, so a
+    full rebuild deleting the directory doesn't delete the lock with it.
+    Readers never take it.
+"""
+
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock below applies
+    fcntl = None
+
+from settings import CHROMA_PATH
+
+VERSION_PATH = os.path.join(CHROMA_PATH, "corpus_version")
+WRITE_LOCK_PATH = CHROMA_PATH + ".lock"
+
+_lock = threading.Lock()
+_write_lock = threading.Lock()  # threads of this process (not re-entrant); flock covers other processes
+_cached = {"stat": None, "version": None}
+
+MISSING_VERSION = "none"  # no stamp written yet
+
+
+def _write(version: str):
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    tmp_path = f"{VERSION_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, VERSION_PATH)  # atomic: readers see old or new, never half
+
+
+def _stat_key():
+    stat = os.stat(VERSION_PATH)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def get_corpus_version() -> str:
+    """Current stamp. Cheap: the file is only re-read when it was replaced."""
+    with _lock:
+        try:
+            key = _stat_key()
+        except FileNotFoundError:
+            _cached.update(stat=None, version=None)
+            return MISSING_VERSION
+
+        if key != _cached["stat"]:
+            try:
+                with open(VERSION_PATH, "r", encoding="utf-8") as f:
+                    version = f.read().strip()
+            except FileNotFoundError:
+                return MISSING_VERSION  # deleted between stat and open (full rebuild)
+            _cached.update(stat=key, version=version)
+        return _cached["version"]
+
+
+def new_corpus_version() -> str:
+    return uuid.uuid4().hex
+
+
+def bump_corpus_version(version: str = None) -> str:
+    """
+    Marks the collection as changed. Returns the new stamp — `version` if
+    given (build_db.py records it in its exports first), else a fresh one.
+    """
+    version = version or new_corpus_version()
+    with _lock:
+        _write(version)
+        _cached.update(stat=_stat_key(), version=version)
+    return version
+
+
+@contextmanager
+def corpus_write_lock():
+    """
+    Exclusive lock for changing the collection, across threads and worker
+    processes. Read the version, write to Chroma and bump, all inside it.
+    """
+    with _write_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(WRITE_LOCK_PATH, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,284 @@
+"""
+Shared embedding service
+========================
+What this does:
+    Keeps ONE copy of each embedding model per process. The build script,
+    the query path and the PDF upload path all ask this module for their
+    embedding function, so:
+      - the ~90MB MiniLM model is only loaded into RAM once, and
+      - uploaded chunks are embedded with exactly the same (normalised)
+        model as the base corpus, so their scores are comparable.
+
+    Models are keyed by (model name, device, normalisation, backend).
+    Asking twice for the same key returns the same object.
+
+Backends (EMBEDDING_BACKEND):
+    torch      — sentence-transformers on PyTorch (default)
+    onnx       — the same MiniLM weights exported to ONNX, run with onnxruntime
+    onnx-int8  — dynamically quantised (int8) ONNX export: smaller, faster on
+                 CPU, very slightly different vectors
+
+    The ONNX backends only need onnxruntime + tokenizers (both already
+    installed via chromadb / transformers) and download the ready-made
+    exports from the model's Hugging Face repo. Override the file with
+    EMBEDDING_ONNX_FILE. Run `python src/bench_embeddings.py` to compare
+    speed and parity against torch before switching.
+
+Query-embedding cache:
+    Every model handed out by get_embeddings() is wrapped in
+    CachedQueryEmbeddings: embed_query() results are kept in a bounded LRU
+    keyed by the whitespace-normalised text (one cache per model, so the
+    model is part of the key). The retriever and the semantic answer cache
+    both go through it, so a hot question skips the MiniLM forward pass.
+    Document embeddings are never cached. QUERY_EMBEDDING_CACHE_SIZE=0
+    turns it off.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# The Hugging Face model for embeddings (free, runs locally)
+# "all-MiniLM-L6-v2" is small (~90MB), fast, and very good quality
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")  # CPU works on any machine
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = library default
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))  # 0 = off
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Exports published alongside the weights in the sentence-transformers repos.
+# quint8_avx2 is dynamically quantised and runs on any x86-64 CPU from the last decade.
+ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": "onnx/model_quint8_avx2.onnx",
+}
+
+_registry = {}
+_lock = threading.Lock()
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    MiniLM sentence embeddings computed with onnxruntime instead of PyTorch.
+
+    Reproduces what sentence-transformers does for this model: tokenise
+    (max 256 tokens), run the transformer, mean-pool over real tokens
+    (attention mask), then L2-normalise.
+    """
+
+    def __init__(self, model_name: str, onnx_file: str, normalize: bool = True,
+                 batch_size: int = 32, max_length: int = 256, threads: int = 0):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        model_path = hf_hub_download(repo_id, onnx_file)
+        tokenizer_path = hf_hub_download(repo_id, "tokenizer.json")
+
+        self.normalize = normalize
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: list) -> np.ndarray:
+        """Embeds texts in batches. Returns a (len(texts), dim) float32 array."""
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real (non-padding) tokens
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(batches)
+
+    def embed_documents(self, texts: list) -> list:
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> list:
+        return self.encode([text])[0].tolist()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    LRU cache in front of embed_query(); embed_documents() passes straight through.
+
+    Whitespace is normalised but case is kept: the key must only merge
+    texts the model would embed identically.
+    """
+
+    def __init__(self, wrapped: Embeddings, max_entries: int = QUERY_EMBEDDING_CACHE_SIZE):
+        self.wrapped = wrapped
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors = OrderedDict()  # normalised text -> vector (list of floats)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return re.sub(r"\s+", " ", text.strip())
+
+    def embed_documents(self, texts: list) -> list:
+        return self.wrapped.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        key = self._key(text)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+                self.hits += 1
+                return list(vector)
+            self.misses += 1
+
+        # Computed outside the lock: two threads missing on the same text
+        # both run the model once, which is cheaper than serialising every miss.
+        vector = self.wrapped.embed_query(text)
+        with self._lock:
+            self._vectors[key] = tuple(vector)
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+        return list(vector)
+
+    def embed_queries(self, texts: list) -> list:
+        """
+        Many queries at once: cached ones come from the LRU, the misses are
+        embedded together in ONE model call. (For MiniLM a query and a
+        document are embedded identically, so embed_documents() is exact.)
+        """
+        keys = [self._key(t) for t in texts]
+        vectors = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._vectors.get(key)
+                if vector is not None:
+                    self._vectors.move_to_end(key)
+                    vectors[i] = list(vector)
+            self.hits += sum(v is not None for v in vectors)
+            self.misses += sum(v is None for v in vectors)
+
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            computed = self.wrapped.embed_documents([texts[i] for i in missing])
+            with self._lock:
+                for i, vector in zip(missing, computed):
+                    vectors[i] = list(vector)
+                    self._vectors[keys[i]] = tuple(vector)
+                    self._vectors.move_to_end(keys[i])
+                while len(self._vectors) > self.max_entries:
+                    self._vectors.popitem(last=False)
+        return vectors
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._vectors),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _load(model_name: str, device: str, normalize: bool, backend: str):
+    if backend == "torch":
+        # Imported here: pulls in torch + sentence-transformers (slow).
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        if EMBEDDING_THREADS:
+            import torch
+            torch.set_num_threads(EMBEDDING_THREADS)
+
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": device},
+            encode_kwargs={"normalize_embeddings": normalize}  # Better search results
+        )
+
+    if backend in ONNX_FILES:
+        if device != "cpu":
+            raise ValueError(f"The {backend} backend only runs on CPU (got device '{device}').")
+        onnx_file = EMBEDDING_ONNX_FILE or ONNX_FILES[backend]
+        return OnnxEmbeddings(model_name, onnx_file, normalize=normalize, threads=EMBEDDING_THREADS)
+
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL, device: str = EMBEDDING_DEVICE,
+                   normalize: bool = True, backend: str = None):
+    """
+    Returns the process-wide embedding function for this model/device/normalisation/backend.
+
+    First time: Downloads the model from the internet (~90MB) and loads it.
+    After that: Returns the already-loaded instance (no extra memory).
+    """
+    backend = backend or EMBEDDING_BACKEND
+    key = (model_name, device, normalize, backend)
+    with _lock:
+        if key not in _registry:
+            print(f"  Loading embedding model '{model_name}' ({backend}) on {device}...")
+            print("  (First run downloads ~90MB model. After that, it's instant.)")
+            model = _load(model_name, device, normalize, backend)
+            if QUERY_EMBEDDING_CACHE_SIZE > 0:
+                model = CachedQueryEmbeddings(model)
+            _registry[key] = model
+            print("  Embedding model loaded!")
+        return _registry[key]
+
+
+def embed_queries(embedding_function, texts: list) -> list:
+    """Embeds a batch of queries in one model call (through the query cache when there is one)."""
+    if isinstance(embedding_function, CachedQueryEmbeddings):
+        return embedding_function.embed_queries(texts)
+    return embedding_function.embed_documents(texts)
+
+
+def query_cache_stats() -> list:
+    """Query-embedding cache size and hit rate per loaded model."""
+    with _lock:
+        models = list(_registry.items())
+    return [
+        {"model": model, "backend": backend, **embeddings.stats()}
+        for (model, _, _, backend), embeddings in models
+        if isinstance(embeddings, CachedQueryEmbeddings)
+    ]
+
+
+def loaded_models() -> list:
+    """Keys of the models currently held in memory, for status endpoints."""
+    with _lock:
+        return [
+            {"model": model, "device": device, "normalize": normalize, "backend": backend}
+            for model, device, normalize, backend in _registry
+        ]
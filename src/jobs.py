@@ -0,0 +1,196 @@
+"""
+Background jobs (PDF ingestion)
+===============================
+What this does:
+    Indexing an uploaded PDF (extract → chunk → embed → write) can take a
+    minute for a big document. Doing it inside the /upload request held
+    an API connection open and hit client timeouts.
+
+    Now /upload only registers a job and hands the work to the ingest
+    pool; it answers 202 with a job id straight away. The client polls
+    /jobs/{job_id}, which reports:
+        status    queued → running → done | failed
+        stage     human-readable step ("Indexing page 12 of 40")
+        progress  0.0 – 1.0
+        result    what the work returned (e.g. chunks_added), once done
+        error     the reason, if it failed
+
+    Finished jobs are forgotten JOB_TTL seconds after they end. A job
+    still queued/running that hasn't reported progress for JOB_TTL seconds
+    (its worker died or was restarted) is marked failed, so nobody polls
+    it forever.
+
+Backends (JOB_STORE_BACKEND):
+    memory  — in-process (default with one API worker)
+    sqlite  — SQLite file shared by all workers, so a poll that lands on
+              another worker still finds the job (default when
+              API_WORKERS > 1). The job itself runs on the worker that
+              accepted the upload.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+from settings import API_WORKERS, CACHE_DIR, open_sqlite
+
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "sqlite" if API_WORKERS > 1 else "memory")
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(CACHE_DIR, "jobs.sqlite3"))
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+
+FINISHED = ("done", "failed")
+STALE_ERROR = "The job stopped reporting progress (the API worker running it was restarted?)"
+
+
+def new_job(kind: str, **fields) -> dict:
+    now = time.time()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "queued",
+        "stage": "Waiting for a free worker",
+        "progress": 0.0,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        **fields,
+    }
+
+
+class JobStore:
+    """Where job records live. Subclasses implement _load/_save/_prune."""
+
+    backend = "none"
+
+    def __init__(self, ttl: int = JOB_TTL):
+        self.ttl = ttl
+
+    def create(self, kind: str, **fields) -> dict:
+        for job_id in self._prune(time.time() - self.ttl):
+            self._fail_stale(job_id)
+        job = new_job(kind, **fields)
+        self._save(job)
+        return job
+
+    def get(self, job_id: str):
+        """The job record, or None if unknown / expired."""
+        job = self._load(job_id)
+        if job is not None and job["status"] not in FINISHED and time.time() - job["updated_at"] > self.ttl:
+            job = self._fail_stale(job_id)
+        return job
+
+    def update(self, job_id: str, **fields):
+        job = self._load(job_id)
+        if job is None:
+            return None
+        job.update(fields, updated_at=time.time())
+        self._save(job)
+        return job
+
+    def _fail_stale(self, job_id: str):
+        return self.update(job_id, status="failed", stage="Failed", error=STALE_ERROR)
+
+    def _load(self, job_id: str):
+        return None
+
+    def _save(self, job: dict):
+        pass
+
+    def _prune(self, before: float) -> list:
+        """Deletes jobs that finished before `before`; returns the ids of unfinished ones idle since then."""
+        return []
+
+
+class InMemoryJobStore(JobStore):
+    backend = "memory"
+
+    def __init__(self, ttl: int = JOB_TTL):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def _load(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _save(self, job: dict):
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+
+    def _prune(self, before: float) -> list:
+        with self._lock:
+            old = [j for j in self._jobs.values() if j["updated_at"] < before]
+            for job in old:
+                if job["status"] in FINISHED:
+                    del self._jobs[job["job_id"]]
+            return [j["job_id"] for j in old if j["status"] not in FINISHED]
+
+
+class SQLiteJobStore(JobStore):
+    backend = "sqlite"
+
+    def __init__(self, path: str = JOB_STORE_PATH, ttl: int = JOB_TTL):
+        super().__init__(ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, data TEXT NOT NULL,"
+                " finished INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _load(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _save(self, job: dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, data, finished, updated_at) VALUES (?, ?, ?, ?)",
+                (job["job_id"], json.dumps(job), int(job["status"] in FINISHED), job["updated_at"]),
+            )
+
+    def _prune(self, before: float) -> list:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE finished = 1 AND updated_at < ?", (before,))
+            return [row[0] for row in self._conn.execute(
+                "SELECT job_id FROM jobs WHERE finished = 0 AND updated_at < ?", (before,)
+            )]
+
+
+def run_job(store: JobStore, job_id: str, fn, *args, **kwargs):
+    """
+    Runs fn(*args, progress=callback, **kwargs) for a job, recording its
+    status. callback(fraction, stage) updates the job's progress. A result
+    dict with an "error" key marks the job failed, like an exception does.
+    """
+    store.update(job_id, status="running", stage="Starting")
+
+    def progress(fraction: float, stage: str):
+        store.update(job_id, progress=round(min(max(fraction, 0.0), 1.0), 3), stage=stage)
+
+    try:
+        result = fn(*args, progress=progress, **kwargs)
+    except Exception as e:
+        store.update(job_id, status="failed", stage="Failed", error=f"{type(e).__name__}: {e}")
+        return
+    if isinstance(result, dict) and result.get("error"):
+        store.update(job_id, status="failed", stage="Failed", error=result["error"], result=result)
+    else:
+        store.update(job_id, status="done", stage="Done", progress=1.0, result=result)
+
+
+def create_job_store(backend: str = JOB_STORE_BACKEND) -> JobStore:
+    """Builds the store selected by JOB_STORE_BACKEND."""
+    if backend == "memory":
+        return InMemoryJobStore()
+    if backend == "sqlite":
+        return SQLiteJobStore()
+    raise ValueError(f"Unknown JOB_STORE_BACKEND '{backend}'. Choose memory or sqlite.")
@@ -0,0 +1,193 @@
+"""
+Lexical (BM25) index + hybrid fusion
+====================================
+What this does:
+    Legal questions often hinge on exact terms — "Statutory Sick Pay",
+    "section 23", "SSP" — that MiniLM embeddings blur into "something
+    about pay". This module keeps a classic inverted index over the same
+    chunks and ranks them with BM25, so exact-term matches surface even
+    when the vector search misses them.
+
+    rag_chain combines both rankings with reciprocal rank fusion (RRF):
+        score(chunk) = sum over rankings of  weight / (RRF_K + rank)
+    RRF only uses ranks, so BM25 scores and cosine similarities never
+    have to be put on the same scale.
+
+Where the index lives:
+    build_db.py writes the base corpus to chroma_db/lexical_index.json
+    (term frequencies per chunk, so loading never re-tokenises). Uploaded
+    chunks are added to the live index by rag_chain.ingest_pdf_bytes and
+    removed again by cleanup_session_chunks.
+
+Settings (see rag_chain.py):
+    HYBRID_SEARCH=1                    turn fusion on (default off)
+    HYBRID_VECTOR_WEIGHT / HYBRID_LEXICAL_WEIGHT   RRF weights (1.0 / 1.0)
+    HYBRID_CANDIDATES                  chunks taken from each ranking (20)
+    RRF_K                              rank damping constant (60)
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from langchain_core.documents import Document
+
+from settings import CHROMA_PATH
+
+LEXICAL_INDEX_PATH = os.path.join(CHROMA_PATH, "lexical_index.json")
+LEXICAL_INDEX_VERSION = 1  # bump when tokenize() changes — old files are then ignored
+
+# Standard BM25 parameters: term-frequency saturation and length normalisation
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Words, numbers and dotted section numbers ("12", "12.3", "s23")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over chunks, supporting add/remove.
+    One lock guards it: uploads mutate the index while searches run.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.docs = {}       # chunk id -> {"text", "metadata", "tf": {term: count}, "length"}
+        self.postings = {}   # term -> {chunk id: count}
+        self.total_length = 0
+        self.version = None  # corpus version this index reflects (set by rag_chain)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _add_counts(self, chunk_id: str, text: str, metadata: dict, tf: dict):
+        if chunk_id in self.docs:
+            self._remove([chunk_id])
+        length = sum(tf.values())
+        self.docs[chunk_id] = {"text": text, "metadata": metadata or {}, "tf": tf, "length": length}
+        self.total_length += length
+        for term, count in tf.items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+
+    def add(self, ids: list, texts: list, metadatas: list):
+        """Indexes (or re-indexes) chunks."""
+        counts = [dict(Counter(tokenize(text))) for text in texts]
+        with self._lock:
+            for chunk_id, text, metadata, tf in zip(ids, texts, metadatas, counts):
+                self._add_counts(chunk_id, text, metadata, tf)
+
+    def remove(self, ids: list):
+        with self._lock:
+            self._remove(ids)
+
+    def _remove(self, ids: list):
+        for chunk_id in ids:
+            doc = self.docs.pop(chunk_id, None)
+            if doc is None:
+                continue
+            self.total_length -= doc["length"]
+            for term in doc["tf"]:
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self.postings[term]
+
+    def matches(self, metadata: dict, filters: dict) -> bool:
+        """Same semantics as rag_chain.build_where()."""
+        if filters.get("source") and metadata.get("source") != filters["source"]:
+            return False
+        if filters.get("page_from") is not None and metadata.get("page_end", -1) < int(filters["page_from"]):
+            return False
+        if filters.get("page_to") is not None and metadata.get("page_start", -1) > int(filters["page_to"]):
+            return False
+        return True
+
+    def search_scored(self, query: str, k: int = 4, filters: dict = None) -> list:
+        """[(bm25 score, Document), ...] best first. Chunks sharing no term with the query are skipped."""
+        filters = filters or {}
+        terms = set(tokenize(query))
+        with self._lock:
+            if not self.docs:
+                return []
+            n_docs = len(self.docs)
+            avg_length = self.total_length / n_docs
+
+            scores = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, count in posting.items():
+                    length = self.docs[chunk_id]["length"]
+                    norm = count + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (BM25_K1 + 1) / norm
+
+            if filters:
+                scores = {cid: s for cid, s in scores.items() if self.matches(self.docs[cid]["metadata"], filters)}
+            best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+            return [(score, self.document(chunk_id)) for chunk_id, score in best]
+
+    def search(self, query: str, k: int = 4, filters: dict = None) -> list:
+        return [doc for _, doc in self.search_scored(query, k, filters)]
+
+    def document(self, chunk_id: str) -> Document:
+        doc = self.docs[chunk_id]
+        return Document(page_content=doc["text"], metadata=dict(doc["metadata"]), id=chunk_id)
+
+    # ── persistence ──────────────────────────────
+
+    def save(self, path: str = LEXICAL_INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            payload = {
+                "version": LEXICAL_INDEX_VERSION,
+                "docs": [
+                    {"id": cid, "text": d["text"], "metadata": d["metadata"], "tf": d["tf"]}
+                    for cid, d in self.docs.items()
+                ],
+            }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)  # atomic: readers never see half a file
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH):
+        """The saved index, or None if there is none (or it was written by an older tokenizer)."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return None
+        if payload.get("version") != LEXICAL_INDEX_VERSION:
+            return None
+        index = cls()
+        for doc in payload["docs"]:
+            index._add_counts(doc["id"], doc["text"], doc["metadata"], doc["tf"])
+        return index
+
+
+def reciprocal_rank_fusion(rankings: list, weights: list, k: int, rrf_k: int = 60) -> list:
+    """
+    Fuses several best-first lists of Documents into one top-k list.
+    A chunk's fused score is sum(weight / (rrf_k + rank)) over the lists it
+    appears in (rank starts at 1); chunks are identified by Document.id.
+    """
+    scores = {}
+    docs = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc in enumerate(ranking, 1):
+            scores[doc.id] = scores.get(doc.id, 0.0) + weight / (rrf_k + rank)
+            docs.setdefault(doc.id, doc)
+    best = sorted(scores, key=lambda chunk_id: -scores[chunk_id])[:k]
+    return [docs[chunk_id] for chunk_id in best]
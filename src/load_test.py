@@ -0,0 +1,176 @@
+"""
+API load test
+=============
+What this does:
+    Fires requests at the FastAPI server from many concurrent clients for
+    a fixed time and reports throughput (requests/second), p50 / p99
+    latency and how many requests failed or were turned away with 503.
+
+    With --workers it starts the server itself once per worker count
+    (uvicorn --workers N, API_WORKERS=N), waits for /ready, runs the same
+    load against each, and prints the speed-up over the first count —
+    the check that extra workers actually buy throughput.
+
+    The default endpoint is /retrieve/batch with one question per request:
+    embedding + search, no LLM, so it measures OUR server rather than
+    the Hugging Face API. Each request gets a unique question suffix so
+    the query-embedding and answer caches can't flatter the numbers
+    (--cached turns that off). Workers can only scale up to the number of
+    CPU cores the box has.
+
+How to run (from the project root, after python src/build_db.py):
+    python src/load_test.py --workers 1,2,4
+    python src/load_test.py --url http://localhost:8000 --concurrency 64 --duration 30
+    python src/load_test.py --url http://localhost:8000 --endpoint ask --duration 60
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import numpy as np
+
+from bench_embeddings import SAMPLE_QUESTIONS
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_request(endpoint: str, n: int, cached: bool) -> tuple:
+    """(path, JSON body) for the n-th request."""
+    question = SAMPLE_QUESTIONS[n % len(SAMPLE_QUESTIONS)]
+    if not cached:
+        question = f"{question} (load test {n})"
+    if endpoint == "ask":
+        return "/ask", {"question": question, "session_id": f"load-test-{n}"}
+    return "/retrieve/batch", {"questions": [question]}
+
+
+async def run_load(url: str, endpoint: str, concurrency: int, duration: float, cached: bool) -> dict:
+    """Keeps `concurrency` requests in flight for `duration` seconds."""
+    latencies = []
+    counts = {"ok": 0, "busy": 0, "failed": 0}
+    counter = iter(range(10 ** 9))
+    deadline = time.perf_counter() + duration
+
+    async def client(http: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            path, body = make_request(endpoint, next(counter), cached)
+            started = time.perf_counter()
+            try:
+                response = await http.post(path, json=body)
+            except httpx.HTTPError:
+                counts["failed"] += 1
+                continue
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+                counts["ok"] += 1
+            elif response.status_code == 503:
+                counts["busy"] += 1
+                await asyncio.sleep(0.05)  # don't spin on a full server
+            else:
+                counts["failed"] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        **counts,
+        "rps": counts["ok"] / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else float("nan"),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000) if latencies else float("nan"),
+    }
+
+
+def wait_until_ready(url: str, workers: int, timeout: float):
+    """
+    Polls /ready until it has answered 200 several times in a row — each
+    request may land on a different worker, and each warms up on its own.
+    """
+    deadline = time.time() + timeout
+    streak = 0
+    while time.time() < deadline:
+        try:
+            ready = httpx.get(f"{url}/ready", timeout=5).status_code == 200
+        except httpx.HTTPError:
+            ready = False
+        streak = streak + 1 if ready else 0
+        if streak >= 3 * workers:
+            return
+        time.sleep(0.5 if ready else 2)
+    raise TimeoutError(f"Server with {workers} worker(s) not ready after {timeout:.0f}s")
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = {**os.environ, "API_WORKERS": str(workers)}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--app-dir", SRC_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        env=env,
+    )
+
+
+def print_table(rows: list):
+    print()
+    print("=" * 78)
+    print(f"{'workers':<9}{'req/s':>10}{'speed-up':>10}{'p50':>12}{'p99':>12}{'ok':>8}{'503':>8}{'failed':>8}")
+    print("-" * 78)
+    baseline = rows[0][1]["rps"] or float("nan")
+    for workers, result in rows:
+        print(f"{workers:<9}{result['rps']:>10.1f}{result['rps'] / baseline:>9.2f}x"
+              f"{result['p50_ms']:>10.1f}ms{result['p99_ms']:>10.1f}ms"
+              f"{result['ok']:>8}{result['busy']:>8}{result['failed']:>8}")
+    print("=" * 78)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency of the RAG API under load.")
+    parser.add_argument("--url", help="Test an already running server (default: start one per --workers)")
+    parser.add_argument("--workers", default="1,2", help="Comma-separated worker counts to start and compare")
+    parser.add_argument("--port", type=int, default=8765, help="Port for servers started by this script")
+    parser.add_argument("--endpoint", choices=["retrieve", "ask"], default="retrieve",
+                        help="retrieve = /retrieve/batch (no LLM), ask = /ask (calls the LLM)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests kept in flight")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load per run")
+    parser.add_argument("--cached", action="store_true", help="Repeat the sample questions verbatim (cache hits)")
+    parser.add_argument("--ready-timeout", type=float, default=300, help="Seconds to wait for warm-up")
+    args = parser.parse_args()
+
+    if args.url:
+        print(f"⏳ {args.concurrency} clients → {args.url} ({args.endpoint}) for {args.duration:.0f}s...")
+        result = asyncio.run(run_load(args.url, args.endpoint, args.concurrency, args.duration, args.cached))
+        print_table([("?", result)])
+        return
+
+    rows = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        url = f"http://127.0.0.1:{args.port}"
+        print(f"\n⏳ Starting API with {workers} worker(s) on port {args.port}...")
+        server = start_server(workers, args.port)
+        try:
+            wait_until_ready(url, workers, args.ready_timeout)
+            print(f"✅ Ready — {args.concurrency} clients for {args.duration:.0f}s ({args.endpoint})")
+            rows.append((workers, asyncio.run(
+                run_load(url, args.endpoint, args.concurrency, args.duration, args.cached)
+            )))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    print_table(rows)
+    print(f"{os.cpu_count()} CPU cores on this machine — throughput stops scaling beyond that.")
+
+
+if __name__ == "__main__":
+    main()
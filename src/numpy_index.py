@@ -0,0 +1,397 @@
+"""
+In-memory NumPy vector index
+============================
+What this does:
+    Our base corpus is a few hundred chunks. For that size, going through
+    Chroma's client stack (SQLite + HNSW + serialisation) on every query
+    costs more than the search itself. This index keeps every chunk's
+    (normalised) embedding in one contiguous matrix and answers top-k with
+    a single matrix-vector product plus np.argpartition — exact search,
+    no approximation.
+
+    It returns the same langchain Document objects (page_content,
+    metadata, id) as the Chroma retriever, and supports the same
+    source / page-range filters as rag_chain.build_where().
+
+Memory-mapped base (vector_index/):
+    build_db.py also writes the base corpus in a compact on-disk format:
+
+        chroma_db/vector_index/CURRENT          name of the live export
+        chroma_db/vector_index/<name>/
+            embeddings.npy   (n, dim) float32 / float16 / int8, already normalised
+            scales.npy       (n,) float32 per-vector scale (int8 only)
+            exact.npy        (n, dim) float32 originals for re-scoring (float16 / int8,
+                             unless VECTOR_RESCORE_CANDIDATES=0 at build time)
+            texts.bin        every chunk's text, UTF-8, back to back
+            offsets.npy      (n + 1,) int64 byte offsets into texts.bin
+            metadata.json    [{"id": ..., "metadata": {...}}, ...]
+            info.json        count, dim, dtype, embedding model and backend,
+                             corpus version it was exported for
+
+    The query service opens embeddings.npy and texts.bin with mmap
+    (read-only). Nothing is copied at startup, and every uvicorn worker
+    shares the same page-cached copy instead of holding its own.
+    Uploaded chunks live in Chroma only; they are loaded into a small
+    in-memory overlay and searched together with the base
+    (LayeredVectorIndex). While the corpus version is still the one the
+    export was written for, there are no uploads and Chroma isn't opened
+    at all.
+
+Quantised storage (VECTOR_STORE_DTYPE):
+    float32  exact (default)
+    float16  half the memory
+    int8     a quarter: each vector is stored as round(v / scale) with its
+             own scale = max|v| / 127
+    Quantised indexes search in two stages: every chunk is scored with the
+    cheap quantised vectors, then the best VECTOR_RESCORE_CANDIDATES are
+    re-scored exactly against their float32 originals.
+
+    What shrinks is RAM, not disk. The originals (exact.npy) stay on disk
+    and are only ever mmapped — each search pages in just its candidates'
+    rows, so the memory a worker touches is the quantised matrix. The
+    export itself is therefore BIGGER than a float32 one (float32 +
+    quantised). Build with VECTOR_RESCORE_CANDIDATES=0 to skip exact.npy
+    (smaller on disk too) and search with the approximate scores alone.
+    An index quantised in memory (NumpyVectorIndex(..., dtype=...)) drops
+    its float32 input and doesn't re-score, unless it is handed
+    exact_vectors explicitly.
+    `python src/bench_retrieval.py --recall` reports recall@k of each
+    storage type against exact float32 search.
+
+How to use:
+    RETRIEVAL_ENGINE=numpy              (default: chroma)
+    VECTOR_STORE_DTYPE=float16          see above
+    python src/bench_retrieval.py       # latency vs Chroma
+"""
+
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+
+from settings import CHROMA_PATH
+
+VECTOR_INDEX_DIR = os.path.join(CHROMA_PATH, "vector_index")
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32")
+VECTOR_RESCORE_CANDIDATES = int(os.getenv("VECTOR_RESCORE_CANDIDATES", "32"))
+
+DTYPES = ("float32", "float16", "int8")
+
+# Quantised matrices are widened to float32 this many rows at a time while
+# scoring, so the temporary copy stays small however big the corpus is.
+SCORE_BLOCK_ROWS = 8192
+
+
+def quantise(vectors, dtype: str) -> tuple:
+    """(stored matrix, per-vector scales or None) for normalised float32 vectors."""
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.clip(np.abs(vectors).max(axis=1, initial=0.0), 1e-12, None) / 127.0
+        stored = np.round(vectors / scales[:, None]).astype(np.int8)
+        return stored, scales.astype(np.float32)
+    raise ValueError(f"Unknown VECTOR_STORE_DTYPE '{dtype}'. Choose one of: {', '.join(DTYPES)}")
+
+
+class MappedTexts:
+    """List-like view of chunk texts stored back to back in one mmapped file."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+
+class NumpyVectorIndex:
+    """Brute-force cosine top-k over a (n_chunks, dim) matrix."""
+
+    def __init__(self, ids: list, vectors, texts, metadatas: list, version: str = None,
+                 dtype: str = "float32", normalised: bool = False, scales=None, exact_vectors=None):
+        """
+        vectors is either raw float vectors (normalised=False: they get
+        normalised and, for dtype float16/int8, quantised here — the float32
+        copy is not kept, so only exact_vectors passed in get re-scored
+        against), or an already stored matrix (normalised=True, e.g. a
+        memory map) with its scales/exact_vectors.
+        """
+        if not normalised:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            if vectors.size == 0:
+                vectors = vectors.reshape(0, 0)
+            # Normalise once here so every search is a plain dot product
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.clip(norms, 1e-12, None)
+            if dtype != "float32":
+                vectors, scales = quantise(vectors, dtype)
+        self.vectors = vectors
+        self.scales = scales
+        self.exact_vectors = exact_vectors
+        self.rescore_candidates = VECTOR_RESCORE_CANDIDATES
+        self.ids = list(ids)
+        self.texts = texts
+        self.metadatas = [m or {} for m in metadatas]
+        self.version = version
+
+        # Filter columns, as arrays so a filter is one vectorised comparison
+        self.sources = np.array([m.get("source") for m in self.metadatas], dtype=object)
+        self.page_starts = np.array([m.get("page_start", -1) for m in self.metadatas], dtype=np.int64)
+        self.page_ends = np.array([m.get("page_end", -1) for m in self.metadatas], dtype=np.int64)
+
+    @classmethod
+    def from_collection(cls, collection, version: str = None, where: dict = None):
+        """Loads chunks (embedding, text, metadata) out of a Chroma collection."""
+        ids, vectors, texts, metadatas = read_collection(collection, where)
+        return cls(ids, vectors, texts, metadatas, version)
+
+    @classmethod
+    def from_mapped(cls, path: str, version: str = None):
+        """Opens an export written by export_index() without copying it into RAM."""
+        vectors = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        scales = exact_vectors = None
+        if os.path.exists(os.path.join(path, "scales.npy")):
+            scales = np.load(os.path.join(path, "scales.npy"))
+        if os.path.exists(os.path.join(path, "exact.npy")):
+            exact_vectors = np.load(os.path.join(path, "exact.npy"), mmap_mode="r")
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        texts_path = os.path.join(path, "texts.bin")
+        if os.path.getsize(texts_path) > 0:
+            blob = np.memmap(texts_path, dtype=np.uint8, mode="r")
+        else:
+            blob = np.zeros(0, dtype=np.uint8)  # mmap can't map an empty file
+        with open(os.path.join(path, "metadata.json"), "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        return cls(
+            [row["id"] for row in rows],
+            vectors,
+            MappedTexts(blob, offsets),
+            [row["metadata"] for row in rows],
+            version,
+            normalised=True,
+            scales=scales,
+            exact_vectors=exact_vectors,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def filter_mask(self, filters: dict = None):
+        """
+        Boolean mask of the chunks matching {"source", "page_from", "page_to"}
+        (same semantics as rag_chain.build_where), or None for "all chunks".
+        """
+        filters = filters or {}
+        mask = None
+
+        def narrow(condition):
+            nonlocal mask
+            mask = condition if mask is None else mask & condition
+
+        if filters.get("source"):
+            narrow(self.sources == filters["source"])
+        if filters.get("page_from") is not None:
+            narrow(self.page_ends >= int(filters["page_from"]))
+        if filters.get("page_to") is not None:
+            narrow(self.page_starts <= int(filters["page_to"]))
+        return mask
+
+    def top_k(self, scores, k: int, mask=None) -> list:
+        """Row indices of the k best scores (best first), skipping masked-out rows."""
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return []
+        # argpartition finds the top k in O(n); only those k get sorted
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [int(i) for i in candidates if scores[i] != -np.inf]
+
+    def documents(self, rows: list) -> list:
+        return [
+            Document(page_content=self.texts[i], metadata=dict(self.metadatas[i]), id=self.ids[i])
+            for i in rows
+        ]
+
+    def approximate_scores(self, queries) -> np.ndarray:
+        """(n_queries, n_chunks) cosine scores from the stored (maybe quantised) matrix."""
+        if self.vectors.dtype == np.float32:
+            return queries @ self.vectors.T
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + block.shape[0]] = queries @ block.T
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def search_scored_batch(self, vectors, k: int = 4, filters: dict = None) -> list:
+        """
+        [(score, Document), ...] best first, per query vector. ONE
+        (n_queries, dim) x (dim, n_chunks) matrix product scores every
+        question against every chunk; quantised indexes then re-score
+        their top candidates exactly.
+        """
+        queries = normalise_queries(vectors)
+        if len(self) == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        scores = self.approximate_scores(queries)
+        mask = self.filter_mask(filters)
+        rescore = self.exact_vectors is not None and self.rescore_candidates > 0
+        results = []
+        for query, row in zip(queries, scores):
+            if rescore:
+                candidates = self.top_k(row, max(k, self.rescore_candidates), mask)
+                exact = np.asarray(self.exact_vectors[candidates], dtype=np.float32) @ query
+                order = np.argsort(-exact)[:k]
+                rows = [candidates[i] for i in order]
+                row_scores = [float(exact[i]) for i in order]
+            else:
+                rows = self.top_k(row, k, mask)
+                row_scores = [float(row[i]) for i in rows]
+            results.append(list(zip(row_scores, self.documents(rows))))
+        return results
+
+    def search_batch(self, vectors, k: int = 4, filters: dict = None) -> list:
+        """Top-k Documents per query vector."""
+        return [[doc for _, doc in hits] for hits in self.search_scored_batch(vectors, k, filters)]
+
+    def search(self, vector, k: int = 4, filters: dict = None) -> list:
+        """Top-k Documents for one query vector."""
+        return self.search_batch([vector], k, filters)[0]
+
+
+class LayeredVectorIndex:
+    """
+    Several indexes searched as one (the mmapped base + the upload overlay).
+    Each layer returns its own top-k; the merged list keeps the best k.
+    """
+
+    def __init__(self, layers: list, version: str = None):
+        self.layers = [layer for layer in layers if layer is not None]
+        self.version = version
+
+    def __len__(self):
+        return sum(len(layer) for layer in self.layers)
+
+    def search_scored_batch(self, vectors, k: int = 4, filters: dict = None) -> list:
+        merged = [[] for _ in range(len(vectors))]
+        for layer in self.layers:
+            for hits, layer_hits in zip(merged, layer.search_scored_batch(vectors, k, filters)):
+                hits.extend(layer_hits)
+        return [sorted(hits, key=lambda hit: -hit[0])[:k] for hits in merged]
+
+    def search_batch(self, vectors, k: int = 4, filters: dict = None) -> list:
+        return [[doc for _, doc in hits] for hits in self.search_scored_batch(vectors, k, filters)]
+
+    def search(self, vector, k: int = 4, filters: dict = None) -> list:
+        return self.search_batch([vector], k, filters)[0]
+
+
+def normalise_queries(vectors) -> np.ndarray:
+    queries = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    return queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+
+
+def read_collection(collection, where: dict = None, batch_size: int = 5000) -> tuple:
+    """(ids, vectors, texts, metadatas) for every chunk of a Chroma collection (matching `where`)."""
+    ids, vectors, texts, metadatas = [], [], [], []
+    offset = 0
+    while True:
+        batch = collection.get(
+            where=where,
+            include=["embeddings", "documents", "metadatas"],
+            limit=batch_size,
+            offset=offset,
+        )
+        ids.extend(batch["ids"])
+        vectors.extend(batch["embeddings"])
+        texts.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+        if len(batch["ids"]) < batch_size:
+            break
+        offset += batch_size
+    return ids, np.array(vectors, dtype=np.float32), texts, metadatas
+
+
+# ─────────────────────────────────────────────
+# On-disk export (written by build_db.py)
+# ─────────────────────────────────────────────
+
+def export_index(ids: list, vectors, texts: list, metadatas: list, dtype: str = VECTOR_STORE_DTYPE,
+                 root: str = VECTOR_INDEX_DIR, info: dict = None,
+                 rescore: bool = VECTOR_RESCORE_CANDIDATES > 0) -> str:
+    """
+    Writes a new export next to the old ones, then switches CURRENT to it.
+    Readers that already mapped the old export keep using it until they
+    reload. Returns the new export's directory.
+
+    A quantised export also gets the float32 originals (exact.npy) for
+    re-scoring, unless rescore is False.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown VECTOR_STORE_DTYPE '{dtype}'. Choose one of: {', '.join(DTYPES)}")
+
+    name = uuid.uuid4().hex
+    path = os.path.join(root, name)
+    os.makedirs(path)
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.size == 0:
+        vectors = vectors.reshape(0, 0)
+    vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    stored, scales = quantise(vectors, dtype)
+    np.save(os.path.join(path, "embeddings.npy"), stored)
+    if scales is not None:
+        np.save(os.path.join(path, "scales.npy"), scales)
+    exact = dtype != "float32" and rescore
+    if exact:
+        np.save(os.path.join(path, "exact.npy"), vectors)
+
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(os.path.join(path, "texts.bin"), "wb") as f:
+        f.writelines(encoded)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+
+    with open(os.path.join(path, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump([{"id": i, "metadata": m or {}} for i, m in zip(ids, metadatas)], f)
+    with open(os.path.join(path, "info.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": len(ids), "dim": int(vectors.shape[1]), "dtype": dtype, "exact": exact,
+                   **(info or {})}, f)
+
+    # Atomic switch: readers see the old export or the new one, never half
+    tmp_path = os.path.join(root, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(root, "CURRENT"))
+
+    # Old exports: on Linux, processes that still map them keep working after
+    # the unlink; elsewhere the delete may fail and is retried on the next build.
+    for entry in os.listdir(root):
+        old = os.path.join(root, entry)
+        if entry != name and os.path.isdir(old):
+            shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def current_export(root: str = VECTOR_INDEX_DIR):
+    """(path, info) of the live export, or None if the build never wrote one."""
+    try:
+        with open(os.path.join(root, "CURRENT"), "r", encoding="utf-8") as f:
+            path = os.path.join(root, f.read().strip())
+        with open(os.path.join(path, "info.json"), "r", encoding="utf-8") as f:
+            return path, json.load(f)
+    except FileNotFoundError:
+        return None
@@ -16,6 +16,16 @@ If it fails: Check the error message — most likely the file path is wrong.
 
 import fitz  # This is PyMuPDF — the library is called 'fitz' internally
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Files longer than this are split into page ranges so one huge statute
+# doesn't keep a single worker busy while the others sit idle.
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+
+# Extraction processes (0 = one per CPU core)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0"))
 
 
 def load_pdf(file_path: str) -> str:
@@ -34,25 +44,144 @@ def load_pdf(file_path: str) -> str:
             f"Make sure the PDF is in  data/ folder and the name matches exactly."
         )
 
-    # Open the PDF
+    # Extract text from every page and join them together
+    # (one join at the end — repeated += would copy the whole string per page)
+    return "".join(text + "\n" for _, _, text in iter_pdf_pages(file_path))
+
+
+# =============================================================
+# STREAMING PAGE API
+# =============================================================
+# Each page comes out as a (source, page_number, text) record the moment it
+# is extracted. Consumers such as chunker.chunk_pages() work page by page,
+# so peak memory is a few pages — not the whole document several times over.
+# page_number is 1-based, like the numbers printed on the page.
+
+def _iter_doc_pages(doc, source: str, start: int = 0, stop=None):
+    try:
+        stop = len(doc) if stop is None else min(stop, len(doc))
+        for page_num in range(start, stop):
+            # get_text() extracts text from this single page
+            yield source, page_num + 1, doc[page_num].get_text()
+    finally:
+        doc.close()
+
+
+def iter_pdf_pages(file_path: str, source: str = None):
+    """Yields (source, page_number, text) for every page of a PDF on disk."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"ERROR: Could not find the file at: {file_path}")
+    source = source or os.path.basename(file_path)
+    return _iter_doc_pages(fitz.open(file_path), source)
+
+
+def iter_pdf_bytes_pages(pdf_bytes: bytes, source: str):
+    """Yields (source, page_number, text) for every page of an in-memory PDF (uploads)."""
+    return _iter_doc_pages(fitz.open(stream=pdf_bytes, filetype="pdf"), source)
+
+
+def pdf_bytes_page_count(pdf_bytes: bytes) -> int:
+    """Number of pages of an in-memory PDF (for upload progress)."""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def _extract_page_range(file_path: str, source: str, start: int, stop) -> list:
+    """
+    Page records for pages [start, stop) of one file.
+    Runs inside the worker processes, so it must stay a top-level function.
+    """
+    return list(_iter_doc_pages(fitz.open(file_path), source, start, stop))
+
+
+def pdf_page_count(file_path: str) -> int:
+    """Number of pages of a PDF on disk."""
     doc = fitz.open(file_path)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
 
-    # Extract text from every page and join them together
-    all_text = ""
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        page_text = page.get_text()  # Extracts text from this single page
-        all_text += page_text + "\n"  # Add a newline between pages
 
-    doc.close()
+def iter_pdf_pages_parallel(file_paths: list, workers: int = PDF_WORKERS,
+                            pages_per_task: int = PAGES_PER_TASK):
+    """
+    Extracts many PDFs across a pool of worker processes and yields
+    (source, page_number, text) records.
+
+    Args:
+        file_paths: PDFs to read
+        workers: Number of processes (0 = one per CPU core, 1 = no pool at all)
+        pages_per_task: Large files are split into page ranges of this size
+
+    Records come out in a deterministic order — file by file in the order
+    given, pages ascending — however the pool schedules the work.
+    Only about 2 tasks per worker are in flight at once, so a slow consumer
+    doesn't make the extracted text of the whole corpus pile up in memory.
+
+    Why processes, not threads?
+        PyMuPDF's text extraction holds the GIL, so threads would take turns
+        instead of running side by side.
+    """
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"ERROR: Could not find the file at: {file_path}")
+
+    # Plan (path, source, start page, stop page) tasks
+    tasks = []
+    for file_path in file_paths:
+        source = os.path.basename(file_path)
+        pages = pdf_page_count(file_path)
+        if pages <= pages_per_task:
+            tasks.append((file_path, source, 0, None))
+        else:
+            tasks.extend((file_path, source, start, start + pages_per_task)
+                         for start in range(0, pages, pages_per_task))
+
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(tasks)) or 1
+
+    if workers == 1:
+        for task in tasks:
+            yield from _iter_doc_pages(fitz.open(task[0]), *task[1:])
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(tasks)
+        in_flight = deque(pool.submit(_extract_page_range, *task)
+                          for task in islice(remaining, workers * 2))
+        while in_flight:
+            # Always wait on the OLDEST task: that is what keeps the order deterministic
+            records = in_flight.popleft().result()
+            next_task = next(remaining, None)
+            if next_task is not None:
+                in_flight.append(pool.submit(_extract_page_range, *next_task))
+            yield from records
+
+
+def load_pdfs_parallel(file_paths: list, workers: int = PDF_WORKERS,
+                       pages_per_task: int = PAGES_PER_TASK) -> list:
+    """
+    Extracts many PDFs in parallel (see iter_pdf_pages_parallel).
 
-    return all_text
+    Returns:
+        One text string per file, in the SAME order as file_paths.
+    """
+    texts = {os.path.basename(p): [] for p in file_paths}
+    for source, _, text in iter_pdf_pages_parallel(file_paths, workers, pages_per_task):
+        texts[source].append(text + "\n")
+    return ["".join(texts[os.path.basename(p)]) for p in file_paths]
 
 
-def load_all_pdfs(data_folder: str = "data") -> str:
+def load_all_pdfs(data_folder: str = "data", workers: int = PDF_WORKERS) -> str:
     """
     Reads ALL PDFs in the data/ folder and combines their text.
     This way  can drop multiple PDFs in later without changing code.
+    Files are extracted in parallel (see load_pdfs_parallel); the
+    combined text is always in sorted file-name order.
     """
 
     if not os.path.exists(data_folder):
@@ -61,16 +190,8 @@ def load_all_pdfs(data_folder: str = "data") -> str:
             f"Make sure 're running this from  project root folder (uk-legal-rag)."
         )
 
-    all_text = ""
-    pdf_count = 0
-
-    for filename in sorted(os.listdir(data_folder)):
-        if filename.lower().endswith(".pdf"):
-            file_path = os.path.join(data_folder, filename)
-            print(f"  Reading: {filename}...")
-            text = load_pdf(file_path)
-            all_text += text + "\n"
-            pdf_count += 1
+    filenames = [f for f in sorted(os.listdir(data_folder)) if f.lower().endswith(".pdf")]
+    pdf_count = len(filenames)
 
     if pdf_count == 0:
         raise FileNotFoundError(
@@ -78,6 +199,11 @@ def load_all_pdfs(data_folder: str = "data") -> str:
             f"Make sure  PDF is in the data/ folder and ends with .pdf"
         )
 
+    for filename in filenames:
+        print(f"  Reading: {filename}...")
+    texts = load_pdfs_parallel([os.path.join(data_folder, f) for f in filenames], workers=workers)
+    all_text = "".join(text + "\n" for text in texts)
+
     print(f"\n  Successfully loaded {pdf_count} PDF(s).")
     return all_text
 
@@ -0,0 +1,139 @@
+"""
+Token budgets for the prompt
+============================
+What this does:
+    Every question sends the LLM: system prompt + retrieved chunks + recent
+    chat turns + the question. Without accounting, that can be 500 tokens
+    one time and 5,000 the next — and prompt length is what dominates
+    time-to-first-token.
+
+    This module counts tokens with tiktoken and:
+      - packs chunks best-first into CONTEXT_TOKEN_BUDGET (a chunk that
+        doesn't fit is skipped; if not even the best one fits, it is cut)
+      - keeps the newest chat turns that fit HISTORY_TOKEN_BUDGET, with
+        each old answer cut to HISTORY_ANSWER_TOKENS
+
+Tokenizer:
+    cl100k_base by default (PROMPT_ENCODING). It is not Llama-3's own
+    tokenizer, but close enough for budgeting. tiktoken downloads the
+    encoding once (the Dockerfile fetches it at build time). Loading it
+    is load_encoding()'s job, which warm_up() runs off the event loop —
+    counting never waits for it: until it is loaded, and for good if it
+    can't be (offline box), we estimate "4 characters ≈ 1 token" rather
+    than stall or refuse to answer.
+"""
+
+import os
+import threading
+
+from langchain_core.documents import Document
+
+PROMPT_ENCODING = os.getenv("PROMPT_ENCODING", "cl100k_base")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "5"))
+HISTORY_ANSWER_TOKENS = int(os.getenv("HISTORY_ANSWER_TOKENS", "150"))
+MIN_CHUNK_TOKENS = 50  # don't bother cutting a chunk down to less than this
+
+TRUNCATION_MARK = " […]"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+class _CharEstimate:
+    """Stand-in when tiktoken can't load its encoding: ~4 characters per token."""
+
+    def encode(self, text: str) -> list:
+        return list(range((len(text) + 3) // 4))
+
+
+_CHAR_ESTIMATE = _CharEstimate()
+
+
+def load_encoding():
+    """
+    Loads the tiktoken encoding (may download it — call this off the event
+    loop; warm_up() does). Falls back to the character estimate for good.
+    """
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+
+                _encoding = tiktoken.get_encoding(PROMPT_ENCODING)
+            except Exception as e:
+                print(f"⚠️ tiktoken encoding '{PROMPT_ENCODING}' unavailable ({type(e).__name__}) "
+                      f"— estimating 4 characters per token")
+                _encoding = _CHAR_ESTIMATE
+        return _encoding
+
+
+def get_encoding():
+    """The loaded encoding, or the character estimate until load_encoding() has run. Never blocks."""
+    return _encoding if _encoding is not None else _CHAR_ESTIMATE
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text))
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """text cut to at most max_tokens tokens (marked with […] when cut)."""
+    encoding = get_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    keep = max(max_tokens - count_tokens(TRUNCATION_MARK), 0)
+    if isinstance(encoding, _CharEstimate):
+        return text[:keep * 4] + TRUNCATION_MARK
+    return encoding.decode(tokens[:keep]) + TRUNCATION_MARK
+
+
+def pack_docs(docs: list, budget: int, render) -> tuple:
+    """
+    Best-first Documents that fit in budget tokens.
+
+    render(position, doc) is the exact text a chunk becomes in the prompt
+    (header included), so its cost is counted as sent. Returns
+    (kept docs, tokens used). Kept docs are in their original order; a
+    cut chunk is a copy with shortened page_content.
+    """
+    kept = []
+    used = 0
+    for doc in docs:
+        cost = count_tokens(render(len(kept) + 1, doc))
+        if used + cost <= budget:
+            kept.append(doc)
+            used += cost
+        elif not kept:
+            # Not even the best chunk fits — send as much of it as we can
+            header = count_tokens(render(1, Document(page_content="", metadata=doc.metadata)))
+            room = budget - header
+            if room >= MIN_CHUNK_TOKENS:
+                kept.append(Document(page_content=truncate(doc.page_content, room),
+                                     metadata=doc.metadata, id=doc.id))
+                used += count_tokens(render(1, kept[0]))
+    return kept, used
+
+
+def trim_history(history: list, budget: int = HISTORY_TOKEN_BUDGET, max_turns: int = HISTORY_MAX_TURNS,
+                 answer_tokens: int = HISTORY_ANSWER_TOKENS) -> tuple:
+    """
+    The newest (question, answer) turns that fit in budget tokens, oldest
+    first, plus the tokens they use. The latest answer is kept whole (it
+    is what follow-ups usually refer to); older answers are cut.
+    """
+    kept = []
+    used = 0
+    for age, (question, answer) in enumerate(reversed(history[-max_turns:] if max_turns > 0 else [])):
+        if age > 0:
+            answer = truncate(answer, answer_tokens)
+        cost = count_tokens(question) + count_tokens(answer)
+        if used + cost > budget:
+            break
+        kept.append((question, answer))
+        used += cost
+    kept.reverse()
+    return kept, used
@@ -4,10 +4,19 @@ Phase 2: RAG Chain — LLM Integration with Hugging Face Inference API
 This script connects  working ChromaDB (Phase 1) to a free LLM.
 It retrieves relevant chunks and generates grounded, accurate answers.
 
+Importing this module is cheap: the embedding model, ChromaDB and the LLM
+client are loaded lazily on first use (or ahead of time by warm_up(),
+which the API runs in the background at startup).
 """
 
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import sys
+import asyncio
+import threading
+import weakref
 from dotenv import load_dotenv
 
 # ─────────────────────────────────────────────
@@ -17,89 +26,586 @@ load_dotenv()
 
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
 
-if not HUGGINGFACE_API_KEY:
-    print("\n❌ ERROR: HUGGINGFACE_API_KEY not found in .env file.")
+if HUGGINGFACE_API_KEY:
+    os.environ["HF_TOKEN"] = HUGGINGFACE_API_KEY
+    os.environ["HUGGINGFACEHUB_API_TOKEN"] = HUGGINGFACE_API_KEY
+    print("✅ API key loaded from .env")
+else:
+    # Not fatal at import time — /ready reports it, and the LLM calls fail
+    # with a clear message. The terminal chat still exits (see __main__).
+    print("\n⚠️ WARNING: HUGGINGFACE_API_KEY not found in .env file.")
     print("   Fix: Open  .env file and add  key:")
     print("   HUGGINGFACE_API_KEY=hf_xxxxxxxxxxxxxxxxxxxxxxxxxx")
     print("\n   Get  free key at: https://huggingface.co/settings/tokens")
     print("   Token type: 'Read' access is enough.\n")
-    sys.exit(1)
-
-os.environ["HF_TOKEN"] = HUGGINGFACE_API_KEY
-os.environ["HUGGINGFACEHUB_API_TOKEN"] = HUGGINGFACE_API_KEY
-
-print("✅ API key loaded from .env")
 
 # ─────────────────────────────────────────────
 # Step 2: Import libraries AFTER env check
 # ─────────────────────────────────────────────
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from huggingface_hub import InferenceClient
+# langchain_chroma / langchain_huggingface pull in chromadb and torch, which
+# take seconds to import — they are imported inside the loaders below.
+from huggingface_hub import InferenceClient, AsyncInferenceClient
+from embeddings import (
+    embed_queries,
+    get_embeddings,
+    loaded_models,
+    query_cache_stats,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+)
+from answer_cache import create_answer_cache, create_semantic_cache, make_key, make_scope_key
+from corpus_version import corpus_write_lock, get_corpus_version, bump_corpus_version
+from reranker import RERANK_CANDIDATES, create_reranker
+from prompt_budget import CONTEXT_TOKEN_BUDGET, count_tokens, load_encoding, pack_docs, trim_history
+from session_store import DEFAULT_SESSION, create_session_store
+from settings import CHROMA_PATH
+from concurrency import (
+    AsyncLimiter,
+    BoundedExecutor,
+    ExecutorSaturated,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_QUEUE,
+    RAG_MAX_CONCURRENCY,
+    RAG_MAX_QUEUE,
+)
 
 # ─────────────────────────────────────────────
-# Step 3: Connect to existing ChromaDB
+# Step 3: Lazy components (ChromaDB, retriever, LLM)
 # ─────────────────────────────────────────────
 # CHROMA_PATH = "./chroma_db"
 
-CHROMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chroma_db")
+MODEL_ID = "meta-llama/Meta-Llama-3-8B-Instruct"
 
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))  # chunks sent to the LLM per question
 
-print("⏳ Loading vector database...")
+# chroma — search through Chroma (default)
+# numpy  — exact search over an in-memory matrix (numpy_index.py). With a
+#          current vector_index/ export and no uploads, Chroma is never opened.
+RETRIEVAL_ENGINE = os.getenv("RETRIEVAL_ENGINE", "chroma")
+
+# Hybrid retrieval: fuse BM25 (lexical_index.py) with the vector ranking
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "0") == "1"
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Optional cross-encoder re-ranking of an over-fetched shortlist (reranker.py)
+reranker = create_reranker()
+
+# /ask/batch: questions of one batch talking to the LLM at the same time
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Loaded components and the last error per component, for /ready.
+# RLock: get_retriever() calls get_vectorstore() while holding it.
+_init_lock = threading.RLock()
+_components = {}
+_component_errors = {}
+_llm_warm = False
+
+# The memory-mapped base corpus for the numpy engine, kept across upload
+# reloads: {"path": export directory, "index": NumpyVectorIndex}
+_mapped_base = {}
+
+# Corpus version the open Chroma handle has seen. Chroma keeps its vector
+# index in memory per process and does not notice rows another worker
+# added, so when the version moves on without us, the handle is reopened.
+_vectorstore_version = {}
+
+
+def _forget_chroma_system(vectorstore):
+    """
+    Chroma shares one System (with its in-memory index) per directory
+    within a process, so opening the directory again would hand back the
+    same stale one. There is no public way to open a second one, so this
+    drops our directory's entry from chromadb's private registry (checked
+    to exist — it does in chromadb 1.x). The old System is not stopped:
+    searches still running on the old handle finish on it, and it is
+    garbage-collected once they let go.
+    """
+    from chromadb.api.shared_system_client import SharedSystemClient
+
+    registry = getattr(SharedSystemClient, "_identifier_to_system", None)
+    identifier = getattr(vectorstore._client, "_identifier", None)
+    if isinstance(registry, dict) and identifier is not None:
+        registry.pop(identifier, None)
+    else:
+        # Unknown chromadb layout: the public reset still works, it just
+        # forgets every shared client in the process, not only ours.
+        print("⚠️ Unrecognised chromadb client registry — clearing the whole system cache")
+        SharedSystemClient.clear_system_cache()
+
+
+def get_query_embeddings():
+    """The embedding model queries are embedded with — the one the database was built with."""
+    with _init_lock:
+        if "embeddings" not in _components:
+            _components["embeddings"] = get_embeddings(EMBEDDING_MODEL)
+        return _components["embeddings"]
+
+
+def get_vectorstore():
+    """
+    Loads the embedding model + ChromaDB on first call, then reuses them.
+    Reopened when another process (API worker, build_db.py) changed the corpus.
+    """
+    version = get_corpus_version()
+    with _init_lock:
+        if "vectorstore" in _components:
+            if _vectorstore_version.get("version") == version:
+                return _components["vectorstore"]
+            print("🔄 Corpus changed in another process — reopening ChromaDB...")
+            _forget_chroma_system(_components["vectorstore"])
+
+        print("⏳ Loading vector database...")
+        try:
+            from langchain_chroma import Chroma
+
+            # Same shared, normalised model the database was built with.
+            embedding_function = get_query_embeddings()
+
+            vectorstore = Chroma(
+                persist_directory=CHROMA_PATH,
+                embedding_function=embedding_function
+            )
+            doc_count = vectorstore._collection.count()
+            if doc_count == 0:
+                raise RuntimeError("ChromaDB is empty. Did  run Phase 1 (python src/build_db.py)?")
+        except Exception as e:
+            _component_errors["vectorstore"] = str(e)
+            print(f"\n❌ ERROR: Could not load ChromaDB from '{CHROMA_PATH}'")
+            print(f"   Details: {e}")
+            raise
+
+        _components["vectorstore"] = vectorstore
+        _vectorstore_version["version"] = version
+        _component_errors.pop("vectorstore", None)
+        print(f"✅ ChromaDB loaded — {doc_count} chunks available")
+        return vectorstore
+
+
+def get_retriever():
+    """Top-k similarity retriever over the vector store."""
+    with _init_lock:
+        vectorstore = get_vectorstore()
+        retriever = _components.get("retriever")
+        if retriever is None or retriever.vectorstore is not vectorstore:
+            _components["retriever"] = vectorstore.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": RETRIEVAL_K}
+            )
+            print(f"✅ Retriever ready (top {RETRIEVAL_K} chunks per query)")
+        return _components["retriever"]
+
+
+def matching_export():
+    """
+    (path, info) of build_db.py's vector_index/ export if it was built with
+    the embedding model AND backend queries are embedded with, else None —
+    vectors from another model or backend don't score on the same scale.
+    """
+    from numpy_index import current_export
+
+    export = current_export()
+    if export is None:
+        return None
+    path, info = export
+    built_with = (info.get("embedding_model"), info.get("embedding_backend"))
+    if built_with != (EMBEDDING_MODEL, EMBEDDING_BACKEND):
+        print(f"⚠️ {path} was built with {built_with[0]} ({built_with[1] or 'unknown backend'}), "
+              f"queries use {EMBEDDING_MODEL} ({EMBEDDING_BACKEND}) — not using it. "
+              f"Re-run python src/build_db.py to re-export.")
+        return None
+    return export
+
+
+def get_numpy_index():
+    """
+    The in-memory index for RETRIEVAL_ENGINE=numpy. Reloaded when the corpus
+    version changes, so uploads/cleanups show up.
+
+    When build_db.py has written a matching vector_index/ export, the base
+    corpus is memory-mapped from it (near-instant, shared between workers).
+    If the corpus version is still the one it was exported for, nothing was
+    uploaded since and Chroma isn't opened at all; otherwise only the
+    uploaded chunks are read out of Chroma. Without an export every chunk
+    is read out of Chroma.
+    """
+    version = get_corpus_version()
+    index = _components.get("numpy_index")
+    if index is not None and index.version == version:
+        return index
+
+    with _init_lock:
+        index = _components.get("numpy_index")
+        if index is None or index.version != version:
+            from numpy_index import LayeredVectorIndex, NumpyVectorIndex
+
+            started = time.perf_counter()
+            try:
+                export = matching_export()
+                if export is not None:
+                    path, info = export
+                    if _mapped_base.get("path") != path:
+                        _mapped_base.update(path=path, index=NumpyVectorIndex.from_mapped(path))
+                        print(f"✅ Mapped {info['count']} base chunks ({info['dtype']}) from {path}")
+                    uploads = None
+                    if info.get("corpus_version") != version:
+                        collection = get_vectorstore()._collection
+                        uploads = NumpyVectorIndex.from_collection(collection, where={"uploaded": "true"})
+                    index = LayeredVectorIndex([_mapped_base["index"], uploads], version)
+                else:
+                    index = NumpyVectorIndex.from_collection(get_vectorstore()._collection, version)
+            except Exception as e:
+                _component_errors["numpy_index"] = str(e)
+                raise
+            _components["numpy_index"] = index
+            _component_errors.pop("numpy_index", None)
+            print(f"✅ NumPy index ready — {len(index)} chunks in {time.perf_counter() - started:.2f}s")
+        return index
+
+
+def get_lexical_index():
+    """
+    BM25 index for HYBRID_SEARCH. The base corpus comes from the file
+    build_db.py wrote; uploaded chunks are read out of Chroma — which isn't
+    opened while the corpus is still exactly what build_db.py exported
+    (see get_numpy_index). Rebuilt when
+    the corpus version changes — unless this process made the change
+    itself, in which case ingest/cleanup already updated it in place.
+    """
+    version = get_corpus_version()
+    index = _components.get("lexical_index")
+    if index is not None and index.version == version:
+        return index
+
+    with _init_lock:
+        index = _components.get("lexical_index")
+        if index is None or index.version != version:
+            from lexical_index import LexicalIndex
+
+            started = time.perf_counter()
+            try:
+                index = LexicalIndex.load()
+                export = matching_export() if index is not None else None
+                if export is None or export[1].get("corpus_version") != version:
+                    # No build-time file (database built by an older build_db): index everything
+                    where = None if index is None else {"uploaded": "true"}
+                    index = index or LexicalIndex()
+                    rows = get_vectorstore()._collection.get(where=where, include=["documents", "metadatas"])
+                    index.add(rows["ids"], rows["documents"], rows["metadatas"])
+            except Exception as e:
+                _component_errors["lexical_index"] = str(e)
+                raise
+            index.version = version
+            _components["lexical_index"] = index
+            _component_errors.pop("lexical_index", None)
+            print(f"✅ BM25 index ready — {len(index)} chunks in {time.perf_counter() - started:.2f}s")
+        return index
+
+
+def _note_own_change(version_before: str, version_after: str):
+    """
+    This process just wrote to Chroma and bumped the version: its own
+    handle already sees the change, so don't reopen it — provided the
+    handle was current at version_before. Call it inside
+    corpus_write_lock(), with version_before read inside the same lock.
+    """
+    with _init_lock:
+        if _vectorstore_version.get("version") == version_before:
+            _vectorstore_version["version"] = version_after
+
+
+def _update_lexical_index(version_before: str, version_after: str, add: dict = None, remove: list = None):
+    """
+    Applies an upload/cleanup to the live BM25 index instead of rebuilding it.
+    Only if the index was current at version_before (read inside the same
+    corpus_write_lock() as the bump) — otherwise it is left at its old
+    version, and the next get_lexical_index() reloads it.
+    """
+    with _init_lock:
+        index = _components.get("lexical_index")
+        if index is None or index.version != version_before:
+            return
+        if add:
+            index.add(add["ids"], add["texts"], add["metadatas"])
+        if remove:
+            index.remove(remove)
+        index.version = version_after
+
+
+def _require_api_key():
+    if not HUGGINGFACE_API_KEY:
+        raise RuntimeError("401 unauthorized: HUGGINGFACE_API_KEY is not set in .env")
+
+
+def get_client() -> InferenceClient:
+    """Synchronous client — used for the warm-up ping."""
+    with _init_lock:
+        if "llm" not in _components:
+            _require_api_key()
+            _components["llm"] = InferenceClient(
+                model=MODEL_ID,
+                token=HUGGINGFACE_API_KEY,
+            )
+        return _components["llm"]
+
+
+def ping_llm() -> bool:
+    """
+    One tiny "Say OK" round-trip to wake the model up (cold start).
+    Returns False instead of raising — a cold LLM must not stop startup.
+    """
+    global _llm_warm
+    print(f"⏳ Connecting to Hugging Face model: {MODEL_ID}")
+    try:
+        get_client().chat_completion(
+            messages=[{"role": "user", "content": "Say OK"}],
+            max_tokens=5,
+        )
+    except Exception as e:
+        _component_errors["llm"] = str(e)
+        print(f"\n❌ ERROR: Could not connect to Hugging Face API.")
+        print(f"   Details: {e}")
+        print("   Common fixes:")
+        print("   1. Check  API key is correct in .env")
+        print("   2. Check  internet connection")
+        print("   3. The model may be loading (cold start — wait 60s and retry)\n")
+        return False
+
+    _llm_warm = True
+    _component_errors.pop("llm", None)
+    print("✅ LLM connected and responding")
+    return True
+
+
+def warm_up() -> dict:
+    """
+    Loads every component ahead of the first request and pings the LLM.
+    Never raises: failures are recorded and reported by component_status().
+    """
+    started = time.perf_counter()
+    try:
+        get_query_embeddings()
+        if RETRIEVAL_ENGINE == "numpy":
+            get_numpy_index()  # opens Chroma only if there are uploads to overlay
+        else:
+            get_retriever()
+        if HYBRID_SEARCH:
+            get_lexical_index()
+    except Exception:
+        pass  # already recorded in _component_errors
+    if reranker is not None:
+        try:
+            reranker.load()
+            _component_errors.pop("reranker", None)
+        except Exception as e:
+            # Not fatal: re-ranking then always falls back to the retriever order
+            _component_errors["reranker"] = str(e)
+            print(f"❌ Re-ranker failed to load: {e}")
+    # tiktoken may download its encoding on first use — here, not on the event loop
+    load_encoding()
+    ping_llm()
+    print(f"✅ Warm-up finished in {time.perf_counter() - started:.1f}s")
+    return component_status()
+
+
+def component_status() -> dict:
+    """Which components are loaded — the body of /ready."""
+    loaded = {
+        "embeddings": "embeddings" in _components,
+        "vectorstore": "vectorstore" in _components,
+        "retriever": "retriever" in _components,
+        "numpy_index": "numpy_index" in _components,
+        "lexical_index": "lexical_index" in _components,
+        "reranker": reranker is not None and reranker.loaded,
+        "llm_client": "llm" in _components,
+        "llm_warm": _llm_warm,
+    }
+    return {
+        # The LLM answering the ping is reported but not required: a cold
+        # model still serves (slowly), while a missing index cannot.
+        "ready": loaded["embeddings"] and bool(HUGGINGFACE_API_KEY)
+                 and (loaded["numpy_index"] if RETRIEVAL_ENGINE == "numpy" else loaded["retriever"])
+                 and (not HYBRID_SEARCH or loaded["lexical_index"]),
+        "retrieval_engine": RETRIEVAL_ENGINE,
+        "hybrid_search": HYBRID_SEARCH,
+        "rerank": reranker is not None,
+        "components": loaded,
+        "embedding_models": loaded_models(),
+        "errors": dict(_component_errors),
+        "import_seconds": IMPORT_SECONDS,
+    }
 
-try:
-    embedding_function = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-    vectorstore = Chroma(
-        persist_directory=CHROMA_PATH,
-        embedding_function=embedding_function
-    )
-    collection = vectorstore._collection
-    doc_count = collection.count()
-    if doc_count == 0:
-        print("\n❌ ERROR: ChromaDB is empty. Did  run Phase 1?")
-        sys.exit(1)
-    print(f"✅ ChromaDB loaded — {doc_count} chunks available")
-except Exception as e:
-    print(f"\n❌ ERROR: Could not load ChromaDB from '{CHROMA_PATH}'")
-    print(f"   Details: {e}")
-    sys.exit(1)
 
 # ─────────────────────────────────────────────
-# Step 4: Set up the retriever
+# Step 4: Retrieval (with optional metadata filters)
 # ─────────────────────────────────────────────
-retriever = vectorstore.as_retriever(
-    search_type="similarity",
-    search_kwargs={"k": 4}
-)
+# Chroma + the embedding model are synchronous, so async callers run
+# retrieval on this bounded pool instead of blocking the event loop.
+retrieval_executor = BoundedExecutor("retrieval", RAG_MAX_CONCURRENCY, RAG_MAX_QUEUE)
+
 
-print("✅ Retriever ready (top 4 chunks per query)")
+def build_where(filters: dict = None) -> dict:
+    """
+    Turns {"source": ..., "page_from": ..., "page_to": ...} into a Chroma
+    `where` filter. Any key may be missing/None. A chunk matches a page range
+    if it OVERLAPS it (a chunk spanning pages 4-5 matches page_from=5).
+
+    Filtering happens inside the vector store, before similarity ranking,
+    so only the matching chunks are scored.
+    """
+    filters = filters or {}
+    conditions = []
+    if filters.get("source"):
+        conditions.append({"source": filters["source"]})
+    if filters.get("page_from") is not None:
+        conditions.append({"page_end": {"$gte": int(filters["page_from"])}})
+    if filters.get("page_to") is not None:
+        conditions.append({"page_start": {"$lte": int(filters["page_to"])}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def vector_search(vectors: list, k: int, filters: dict = None) -> list:
+    """Top-k Documents per query vector from the configured engine (numpy or Chroma)."""
+    if RETRIEVAL_ENGINE == "numpy":
+        return get_numpy_index().search_batch(vectors, k, filters)
+
+    from langchain_core.documents import Document
+
+    # One query() call for every vector
+    results = get_retriever().vectorstore._collection.query(
+        query_embeddings=vectors,
+        n_results=k,
+        where=build_where(filters),
+        include=["documents", "metadatas"],
+    )
+    return [
+        [Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+         for chunk_id, text, metadata in zip(ids, texts, metadatas)]
+        for ids, texts, metadatas in zip(results["ids"], results["documents"], results["metadatas"])
+    ]
+
+
+def first_stage_search(questions: list, vectors: list, k: int, filters: dict = None) -> list:
+    """
+    Vector search, fused with BM25 by reciprocal rank fusion when
+    HYBRID_SEARCH is on: each ranking contributes its top HYBRID_CANDIDATES,
+    and the best k fused chunks are returned.
+    """
+    if not HYBRID_SEARCH:
+        return vector_search(vectors, k, filters)
+
+    from lexical_index import reciprocal_rank_fusion
+
+    candidates = max(k, HYBRID_CANDIDATES)
+    lexical = get_lexical_index()
+    return [
+        reciprocal_rank_fusion(
+            [vector_hits, lexical.search(question, candidates, filters)],
+            [HYBRID_VECTOR_WEIGHT, HYBRID_LEXICAL_WEIGHT],
+            k,
+            RRF_K,
+        )
+        for question, vector_hits in zip(questions, vector_search(vectors, candidates, filters))
+    ]
+
+
+def search(questions: list, vectors: list, k: int, filters: dict = None) -> list:
+    """
+    First-stage retrieval, then — with RERANK on — the cross-encoder picks
+    the best k out of RERANK_CANDIDATES (within its time budget).
+    """
+    if reranker is None:
+        return first_stage_search(questions, vectors, k, filters)
+    shortlist = first_stage_search(questions, vectors, max(k, RERANK_CANDIDATES), filters)
+    return reranker.rerank_batch(questions, shortlist, k)
+
+
+def retrieve_with_vector(question: str, filters: dict = None) -> tuple:
+    """
+    Embeds the question ONCE and searches with that vector.
+    Returns (question_vector, docs) — the semantic answer cache reuses the
+    vector instead of embedding the question a second time.
+    """
+    vector = get_query_embeddings().embed_query(question)
+    return vector, search([question], [vector], RETRIEVAL_K, filters)[0]
+
+
+def retrieve(question: str, filters: dict = None) -> list:
+    return retrieve_with_vector(question, filters)[1]
+
+
+async def retrieve_async(question: str, filters: dict = None) -> list:
+    """Async wrapper around retrieve() — runs on retrieval_executor."""
+    return await retrieval_executor.run(retrieve, question, filters)
+
+
+async def retrieve_with_vector_async(question: str, filters: dict = None) -> tuple:
+    return await retrieval_executor.run(retrieve_with_vector, question, filters)
+
+
+def retrieve_batch_with_vectors(questions: list, filters: dict = None, k: int = RETRIEVAL_K) -> tuple:
+    """
+    Retrieval for many questions at once. Returns (vectors, docs_per_question).
+
+    All questions are embedded in ONE model call. The numpy engine then
+    scores them in one matrix-matrix product; Chroma gets them in one
+    query() call (see vector_search).
+    """
+    if not questions:
+        return [], []
+    vectors = embed_queries(get_query_embeddings(), questions)
+    return vectors, search(questions, vectors, k, filters)
+
+
+def retrieve_batch(questions: list, filters: dict = None, k: int = RETRIEVAL_K) -> list:
+    """Top-k Documents per question, in the same order as questions."""
+    return retrieve_batch_with_vectors(questions, filters, k)[1]
+
+
+async def retrieve_batch_async(questions: list, filters: dict = None, k: int = RETRIEVAL_K) -> list:
+    """The whole batch takes ONE slot on retrieval_executor."""
+    return await retrieval_executor.run(retrieve_batch, questions, filters, k)
 
 # ─────────────────────────────────────────────
-# Step 5: Initialize the Hugging Face LLM
+# Step 5: Async LLM client for the request path
 # ─────────────────────────────────────────────
-MODEL_ID = "meta-llama/Meta-Llama-3-8B-Instruct"
+# One client per event loop: the client keeps a shared HTTP connection pool,
+# and that pool belongs to the loop it was opened on (uvicorn's loop in the
+# API, a private loop for ask()).
+_async_clients = weakref.WeakKeyDictionary()
 
-print(f"⏳ Connecting to Hugging Face model: {MODEL_ID}")
+# Caps how many generations are in flight at once; callers beyond
+# LLM_MAX_CONCURRENCY + LLM_MAX_QUEUE get ExecutorSaturated (→ 503 in the API).
+llm_limiter = AsyncLimiter("llm", LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE)
 
-try:
-    client = InferenceClient(
-        model=MODEL_ID,
-        token=HUGGINGFACE_API_KEY,
-    )
-    test_response = client.chat_completion(
-        messages=[{"role": "user", "content": "Say OK"}],
-        max_tokens=5,
-    )
-    print("✅ LLM connected and responding")
-except Exception as e:
-    print(f"\n❌ ERROR: Could not connect to Hugging Face API.")
-    print(f"   Details: {e}")
-    print("   Common fixes:")
-    print("   1. Check  API key is correct in .env")
-    print("   2. Check  internet connection")
-    print("   3. The model may be loading (cold start — wait 60s and retry)\n")
-    sys.exit(1)
+
+def get_async_client() -> AsyncInferenceClient:
+    """Returns the AsyncInferenceClient bound to the running event loop."""
+    _require_api_key()
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = AsyncInferenceClient(model=MODEL_ID, token=HUGGINGFACE_API_KEY)
+        _async_clients[loop] = async_client
+    return async_client
+
+
+def concurrency_stats() -> dict:
+    """Load on the retrieval pool and the LLM limiter, for /health."""
+    stats = {
+        "retrieval": retrieval_executor.stats(),
+        "llm": llm_limiter.stats(),
+    }
+    if reranker is not None:
+        stats["rerank"] = reranker.stats()
+    return stats
 
 # ─────────────────────────────────────────────
 # Step 6: The Anti-Hallucination System Prompt
@@ -118,40 +624,192 @@ STRICT RULES:
 # Step 7: Helper functions
 # ─────────────────────────────────────────────
 
+def format_doc(position: int, doc) -> str:
+    """One retrieved chunk as it appears in the prompt."""
+    source = doc.metadata.get("source", "Unknown")
+    page = doc.metadata.get("page", "?")
+    return f"[Source {position}: {source}, Page {page}]\n{doc.page_content}"
+
+
 def format_docs(docs):
     """Turn retrieved Document objects into a single text block."""
-    formatted = []
-    for i, doc in enumerate(docs, 1):
-        source = doc.metadata.get("source", "Unknown")
-        page = doc.metadata.get("page", "?")
-        formatted.append(
-            f"[Source {i}: {source}, Page {page}]\n{doc.page_content}"
-        )
-    return "\n\n---\n\n".join(formatted)
+    return "\n\n---\n\n".join(format_doc(i, doc) for i, doc in enumerate(docs, 1))
 
 # ─────────────────────────────────────────────
 # Step 8: Conversational Memory
 # ─────────────────────────────────────────────
-chat_history = []
+# One bounded history per session_id (see session_store.py)
+session_store = create_session_store()
 
 def format_chat_history(history):
-    """Convert chat history into messages for the chat API."""
+    """
+    Convert chat history into messages for the chat API: the newest turns
+    that fit HISTORY_TOKEN_BUDGET, older answers shortened (prompt_budget.py).
+    """
     messages = []
-    for human_msg, ai_msg in history[-5:]:
+    for human_msg, ai_msg in trim_history(history)[0]:
         messages.append({"role": "user", "content": human_msg})
         messages.append({"role": "assistant", "content": ai_msg})
     return messages
 
+# ─────────────────────────────────────────────
+# Step 8b: Answer cache
+# ─────────────────────────────────────────────
+# Repeated questions skip retrieval AND the LLM; paraphrases that retrieve
+# the same chunks skip the LLM (semantic cache). See answer_cache.py.
+#
+# With several API workers the answer cache and session histories are
+# SQLite files, and a read or write can wait on another worker's lock —
+# so the async paths below call them through asyncio.to_thread().
+answer_cache = create_answer_cache()
+semantic_cache = create_semantic_cache()
+
+
+def answer_params(filters: dict = None, history: list = None) -> dict:
+    """Everything besides the question that can change the answer."""
+    return {
+        "filters": {k: v for k, v in (filters or {}).items() if v is not None},
+        "k": RETRIEVAL_K,
+        "context_token_budget": CONTEXT_TOKEN_BUDGET,
+        "retrieval": {
+            "engine": RETRIEVAL_ENGINE,
+            "hybrid": HYBRID_SEARCH,
+            "rerank": reranker.model_name if reranker is not None else None,
+        },
+        "model": MODEL_ID,
+        "embedding_model": EMBEDDING_MODEL,
+        "corpus_version": get_corpus_version(),
+        "history": format_chat_history(history or []),
+    }
+
+
+def answer_cache_key(question: str, filters: dict = None, history: list = None) -> str:
+    return make_key(question, **answer_params(filters, history))
+
+
+def chunk_ids(docs: list) -> list:
+    """Identity of each retrieved chunk (Chroma id, or a content hash as fallback)."""
+    return [doc.id or make_scope_key(text=doc.page_content, **doc.metadata) for doc in docs]
+
+
+def lookup_semantic(filters: dict, vector, docs: list, history: list = None):
+    if semantic_cache is None:
+        return None
+    return semantic_cache.get(make_scope_key(**answer_params(filters, history)), vector, chunk_ids(docs))
+
+
+def store_answer(cache_key: str, filters: dict, vector, docs: list, result: dict, history: list = None):
+    """Puts a successful answer in both caches. Call BEFORE appending to the session history."""
+    answer_cache.set(cache_key, result)
+    if semantic_cache is not None:
+        semantic_cache.set(make_scope_key(**answer_params(filters, history)), vector, chunk_ids(docs), result)
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters for /cache/stats."""
+    return {
+        "answers": answer_cache.stats(),
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+        "query_embeddings": query_cache_stats(),
+        "sessions": session_store.stats(),
+    }
+
 # ─────────────────────────────────────────────
 # Step 9: The main ask() function
 # ─────────────────────────────────────────────
-def ask(question: str) -> dict:
+def build_prompt(question: str, retrieved_docs: list, history: list = None) -> tuple:
+    """
+    System prompt + retrieved context + recent history + the new question.
+
+    Chunks are packed best-first into CONTEXT_TOKEN_BUDGET, so the prompt
+    size stays predictable. Returns (messages, docs actually sent,
+    prompt token counts).
+    """
+    docs, context_tokens = pack_docs(retrieved_docs, CONTEXT_TOKEN_BUDGET, format_doc)
+    system_with_context = f"{SYSTEM_PROMPT}\n\nCONTEXT:\n{format_docs(docs)}"
+
+    messages = [{"role": "system", "content": system_with_context}]
+    messages.extend(format_chat_history(history or []))
+    messages.append({"role": "user", "content": question})
+
+    history_tokens = sum(count_tokens(m["content"]) for m in messages[1:-1])
+    question_tokens = count_tokens(question)
+    system_tokens = count_tokens(system_with_context) - context_tokens
+    usage = {
+        "system": system_tokens,
+        "context": context_tokens,
+        "history": history_tokens,
+        "question": question_tokens,
+        "total": system_tokens + context_tokens + history_tokens + question_tokens,
+        "chunks_sent": len(docs),
+        "chunks_dropped": len(retrieved_docs) - len(docs),
+    }
+    return messages, docs, usage
+
+
+def format_sources(retrieved_docs: list) -> list:
+    """Source info returned alongside the answer."""
+    sources = []
+    for doc in retrieved_docs:
+        sources.append({
+            "source": doc.metadata.get("source", "Unknown"),
+            "page": doc.metadata.get("page", "?"),
+            "page_start": doc.metadata.get("page_start"),
+            "page_end": doc.metadata.get("page_end"),
+            "preview": doc.page_content[:100] + "..."
+        })
+    return sources
+
+
+def error_result(e: Exception) -> dict:
+    """Turns an LLM/retrieval failure into a friendly answer."""
+    error_msg = str(e)
+    error_type = type(e).__name__
+
+    if "429" in error_msg or "rate" in error_msg.lower():
+        return {
+            "answer": "⚠️ Rate limit hit. Wait 60 seconds and try again.",
+            "sources": [], "num_chunks": 0
+        }
+    elif "503" in error_msg or "loading" in error_msg.lower():
+        return {
+            "answer": "⏳ Model is loading (cold start). Wait 30-60s and retry.",
+            "sources": [], "num_chunks": 0
+        }
+    elif "401" in error_msg or "unauthorized" in error_msg.lower():
+        return {
+            "answer": "❌ API key invalid. Check HUGGINGFACE_API_KEY in .env.",
+            "sources": [], "num_chunks": 0
+        }
+    else:
+        return {
+            "answer": f"❌ Unexpected error ({error_type}): {error_msg}",
+            "sources": [], "num_chunks": 0
+        }
+
+
+async def ask_async(question: str, filters: dict = None, session_id: str = DEFAULT_SESSION) -> dict:
     """
     Ask a question about  UK regulatory documents.
+    filters optionally restricts retrieval to one document and/or a
+    page range — see build_where(). session_id selects whose chat
+    history the question continues (see session_store.py).
+
+    Retrieval runs on retrieval_executor, generation goes through the
+    AsyncInferenceClient, so many questions can be in flight on one loop.
+    ExecutorSaturated is re-raised so the API can answer 503.
     """
     try:
+        # Step 0: Serve repeats from the answer cache
+        history = await asyncio.to_thread(session_store.get, session_id)
+        cache_key = answer_cache_key(question, filters, history)
+        cached = await asyncio.to_thread(answer_cache.get, cache_key)
+        if cached is not None:
+            await asyncio.to_thread(session_store.append, session_id, question, cached["answer"])
+            return {**cached, "cached": True}
+
         # Step A: Retrieve relevant chunks
-        retrieved_docs = retriever.invoke(question)
+        question_vector, retrieved_docs = await retrieve_with_vector_async(question, filters)
 
         if not retrieved_docs:
             return {
@@ -160,144 +818,367 @@ def ask(question: str) -> dict:
                 "num_chunks": 0
             }
 
-        # Step B: Format context
-        context_text = format_docs(retrieved_docs)
+        # Step A2: A paraphrase of an answered question, over the same chunks?
+        similar = lookup_semantic(filters, question_vector, retrieved_docs, history)
+        if similar is not None:
+            await asyncio.to_thread(answer_cache.set, cache_key, similar)
+            await asyncio.to_thread(session_store.append, session_id, question, similar["answer"])
+            return {**similar, "cached": True}
 
-        # Step C: Build messages for chat API
-        system_with_context = f"{SYSTEM_PROMPT}\n\nCONTEXT:\n{context_text}"
-
-        messages = [{"role": "system", "content": system_with_context}]
-        messages.extend(format_chat_history(chat_history))
-        messages.append({"role": "user", "content": question})
+        # Step B + C: Pack context into the token budget and build messages
+        messages, sent_docs, prompt_tokens = build_prompt(question, retrieved_docs, history)
 
         # Step D: Call the LLM
-        response = client.chat_completion(
-            messages=messages,
-            max_tokens=512,
-            temperature=0.1,
-            top_p=0.9,
-        )
+        async with llm_limiter.slot():
+            response = await get_async_client().chat_completion(
+                messages=messages,
+                max_tokens=512,
+                temperature=0.1,
+                top_p=0.9,
+            )
 
         # Step E: Extract the answer
         answer = response.choices[0].message.content.strip()
 
-        # Step F: Update conversation memory
-        chat_history.append((question, answer))
-
-        # Step G: Prepare source info
-        sources = []
-        for doc in retrieved_docs:
-            sources.append({
-                "source": doc.metadata.get("source", "Unknown"),
-                "page": doc.metadata.get("page", "?"),
-                "preview": doc.page_content[:100] + "..."
-            })
-
-        return {
+        # Step F: Prepare source info
+        result = {
             "answer": answer,
-            "sources": sources,
-            "num_chunks": len(retrieved_docs)
+            "sources": format_sources(sent_docs),
+            "num_chunks": len(sent_docs)
         }
+        # Only successful answers are cached — errors return above/below
+        await asyncio.to_thread(store_answer, cache_key, filters, question_vector, retrieved_docs, result, history)
 
+        # Step G: Update conversation memory
+        await asyncio.to_thread(session_store.append, session_id, question, answer)
+        return {**result, "cached": False, "prompt_tokens": prompt_tokens}
+
+    except ExecutorSaturated:
+        raise
     except Exception as e:
-        error_msg = str(e)
-        error_type = type(e).__name__
+        return error_result(e)
 
-        if "429" in error_msg or "rate" in error_msg.lower():
-            return {
-                "answer": "⚠️ Rate limit hit. Wait 60 seconds and try again.",
-                "sources": [], "num_chunks": 0
-            }
-        elif "503" in error_msg or "loading" in error_msg.lower():
-            return {
-                "answer": "⏳ Model is loading (cold start). Wait 30-60s and retry.",
-                "sources": [], "num_chunks": 0
-            }
-        elif "401" in error_msg or "unauthorized" in error_msg.lower():
-            return {
-                "answer": "❌ API key invalid. Check HUGGINGFACE_API_KEY in .env.",
-                "sources": [], "num_chunks": 0
-            }
+
+async def ask_stream(question: str, filters: dict = None, session_id: str = DEFAULT_SESSION):
+    """
+    Streaming version of ask_async(). An async generator of (event, data):
+
+        ("sources", {"sources": [...], "num_chunks": n,
+                     "prompt_tokens": {...}})          — once, before any tokens
+        ("token",   {"text": "..."})                      — as the LLM produces them
+        ("done",    {"answer": "...full answer..."})      — once, at the end
+        ("error",   {"answer": "...friendly message..."}) — instead of done, on failure
+
+    The LLM slot is taken BEFORE the first event, so if the server is
+    saturated ExecutorSaturated surfaces on the first __anext__() —
+    early enough for the API to answer 503 instead of starting a stream.
+    """
+    history = await asyncio.to_thread(session_store.get, session_id)
+    cache_key = answer_cache_key(question, filters, history)
+    cached = await asyncio.to_thread(answer_cache.get, cache_key)
+    if cached is not None:
+        await asyncio.to_thread(session_store.append, session_id, question, cached["answer"])
+        yield "sources", {"sources": cached["sources"], "num_chunks": cached["num_chunks"]}
+        yield "token", {"text": cached["answer"]}
+        yield "done", {"answer": cached["answer"], "cached": True}
+        return
+
+    async with llm_limiter.slot():
+        question_vector, retrieved_docs = await retrieve_with_vector_async(question, filters)
+
+        if not retrieved_docs:
+            yield "sources", {"sources": [], "num_chunks": 0}
+            yield "done", {"answer": "No relevant documents found in the database."}
+            return
+
+        similar = lookup_semantic(filters, question_vector, retrieved_docs, history)
+        if similar is not None:
+            await asyncio.to_thread(answer_cache.set, cache_key, similar)
+            await asyncio.to_thread(session_store.append, session_id, question, similar["answer"])
+            yield "sources", {"sources": similar["sources"], "num_chunks": similar["num_chunks"]}
+            yield "token", {"text": similar["answer"]}
+            yield "done", {"answer": similar["answer"], "cached": True}
+            return
+
+        messages, sent_docs, prompt_tokens = build_prompt(question, retrieved_docs, history)
+        yield "sources", {
+            "sources": format_sources(sent_docs),
+            "num_chunks": len(sent_docs),
+            "prompt_tokens": prompt_tokens,
+        }
+
+        try:
+            stream = await get_async_client().chat_completion(
+                messages=messages,
+                max_tokens=512,
+                temperature=0.1,
+                top_p=0.9,
+                stream=True,
+            )
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    parts.append(text)
+                    yield "token", {"text": text}
+        except Exception as e:
+            yield "error", {"answer": error_result(e)["answer"]}
+            return
+
+        answer = "".join(parts).strip()
+        try:
+            await asyncio.to_thread(store_answer, cache_key, filters, question_vector, retrieved_docs, {
+                "answer": answer,
+                "sources": format_sources(sent_docs),
+                "num_chunks": len(sent_docs),
+            }, history)
+            await asyncio.to_thread(session_store.append, session_id, question, answer)
+        except Exception as e:
+            # The client already has every token: a cache or history write
+            # failing (e.g. a locked SQLite file) must not turn that into an error
+            print(f"⚠️ Could not save the streamed answer ({type(e).__name__}: {e})")
+        yield "done", {"answer": answer, "cached": False}
+
+
+async def ask_batch(questions: list, filters: dict = None) -> list:
+    """
+    Answers many INDEPENDENT questions (e.g. a compliance checklist).
+
+    Unlike ask_async(), batch questions neither see nor update any
+    session's history. Retrieval for the whole batch is one call (see
+    retrieve_batch_with_vectors); both answer caches are used; at most
+    BATCH_LLM_CONCURRENCY questions of the batch wait on the LLM at once,
+    so a big batch can't fill llm_limiter's queue and starve /ask.
+
+    Returns one ask_async()-style result per question, in order. A failing
+    question gets a friendly error answer; the rest still complete.
+    """
+    history = []
+    results = [None] * len(questions)
+    keys = [answer_cache_key(q, filters, history) for q in questions]
+
+    # Step 1: exact repeats (one trip off the loop for all the lookups)
+    todo = []
+    hits = await asyncio.to_thread(lambda: [answer_cache.get(key) for key in keys])
+    for i, cached in enumerate(hits):
+        if cached is not None:
+            results[i] = {**cached, "cached": True}
         else:
-            return {
-                "answer": f"❌ Unexpected error ({error_type}): {error_msg}",
-                "sources": [], "num_chunks": 0
-            }
+            todo.append(i)
+    if not todo:
+        return results
+
+    # Step 2: one retrieval call for everything left
+    vectors, docs_per_question = await retrieval_executor.run(
+        retrieve_batch_with_vectors, [questions[i] for i in todo], filters
+    )
+
+    # Step 3: paraphrase cache, then the LLM
+    batch_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer(i, vector, docs):
+        if not docs:
+            return {"answer": "No relevant documents found in the database.",
+                    "sources": [], "num_chunks": 0}
+        similar = lookup_semantic(filters, vector, docs, history)
+        if similar is not None:
+            await asyncio.to_thread(answer_cache.set, keys[i], similar)
+            return {**similar, "cached": True}
+        messages, sent_docs, prompt_tokens = build_prompt(questions[i], docs, history)
+        try:
+            async with batch_slots, llm_limiter.slot():
+                response = await get_async_client().chat_completion(
+                    messages=messages,
+                    max_tokens=512,
+                    temperature=0.1,
+                    top_p=0.9,
+                )
+        except Exception as e:
+            return error_result(e)
+        result = {
+            "answer": response.choices[0].message.content.strip(),
+            "sources": format_sources(sent_docs),
+            "num_chunks": len(sent_docs),
+        }
+        await asyncio.to_thread(store_answer, keys[i], filters, vector, docs, result, history)
+        return {**result, "cached": False, "prompt_tokens": prompt_tokens}
+
+    answers = await asyncio.gather(*(
+        answer(i, vector, docs) for i, vector, docs in zip(todo, vectors, docs_per_question)
+    ))
+    for i, result in zip(todo, answers):
+        results[i] = result
+    return results
+
+
+# ask() drives ask_async() on one private loop that lives for the whole
+# process, so the async client's connection pool is reused between calls
+# (asyncio.run() would open and throw away a loop — and a pool — each time).
+_sync_loop = None
+
+
+def ask(question: str, filters: dict = None) -> dict:
+    """
+    Synchronous wrapper around ask_async() for the terminal chat loop.
+    Not for use from inside a running event loop — await ask_async() there.
+    """
+    global _sync_loop
+    if _sync_loop is None:
+        _sync_loop = asyncio.new_event_loop()
+    return _sync_loop.run_until_complete(ask_async(question, filters))
 
 
 # ============================================================
 # PDF UPLOAD FEATURE (Dynamic document ingestion)
 # ============================================================
 
-import fitz  # PyMuPDF - already installed
-# from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pdf_loader import iter_pdf_bytes_pages, iter_pdf_pages, pdf_bytes_page_count, pdf_page_count
+from chunker import chunk_pages
 import uuid
 
-def ingest_pdf_bytes(pdf_bytes: bytes, filename: str, session_id: str) -> dict:
+# Chunks embedded + written per add_texts() call while streaming an upload
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+
+
+def ingest_pdf_file(path: str, filename: str, session_id: str, progress=None) -> dict:
+    """
+    Same as ingest_pdf_bytes() for a PDF on disk — what /upload uses
+    (uploads.py spools the upload to a file). PyMuPDF reads pages from
+    the file on demand instead of from a copy of it in memory.
+    """
+    return _ingest_pages(lambda: iter_pdf_pages(path, filename), pdf_page_count(path), session_id, progress)
+
+
+def ingest_pdf_bytes(pdf_bytes: bytes, filename: str, session_id: str, progress=None) -> dict:
     """
     Takes raw PDF bytes from upload, chunks, embeds, and adds
     to the EXISTING ChromaDB collection. Tagged with session_id
     so we can delete only this session's chunks later.
     """
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text() + "\n"
-    doc.close()
-    
-    if not full_text.strip():
-        return {"chunks_added": 0, "chunk_ids": [], "error": "PDF contains no extractable text. It may be a scanned image."}
-    
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    chunks = splitter.split_text(full_text)
-    
-    collection = vectorstore._collection
-    
+    return _ingest_pages(lambda: iter_pdf_bytes_pages(pdf_bytes, filename), pdf_bytes_page_count(pdf_bytes),
+                         session_id, progress)
+
+
+def _ingest_pages(open_pages, pages_total: int, session_id: str, progress=None) -> dict:
+    """
+    Pages stream through the chunker and chunks are embedded in batches,
+    so only a few pages of text are held in memory at any time.
+
+    progress(fraction, stage), if given, is called after every batch —
+    the upload job (jobs.py) reports it to /jobs/{job_id}.
+    """
+    progress = progress or (lambda fraction, stage: None)
+    progress(0.0, "Waiting for other uploads to finish")
+    # One writer at a time across all workers (see corpus_version.py)
+    with corpus_write_lock():
+        version_before = get_corpus_version()
+        progress(0.0, "Loading the index")
+        vectorstore = get_vectorstore()  # current at version_before: nobody else can write now
+        return _write_pages(vectorstore, version_before, open_pages, pages_total, session_id, progress)
+
+
+def _write_pages(vectorstore, version_before: str, open_pages, pages_total: int, session_id: str,
+                 progress) -> dict:
+    """The body of _ingest_pages(), run while holding corpus_write_lock()."""
+    pages_read = [0]
+    batches_sent = [0]
     chunk_ids = []
-    documents = []
-    metadatas = []
-    
-    for i, chunk in enumerate(chunks):
-        chunk_id = f"upload_{session_id}_{uuid.uuid4().hex[:8]}"
-        chunk_ids.append(chunk_id)
-        documents.append(chunk)
-        metadatas.append({
-            "source": filename,
-            "page": str(i),
-            "session_id": session_id,
-            "uploaded": "true"
-        })
-    
-    collection.add(
-        ids=chunk_ids,
-        documents=documents,
-        metadatas=metadatas
-    )
-    
-    return {"chunks_added": len(chunks), "chunk_ids": chunk_ids}
+    batch = {"texts": [], "metadatas": [], "ids": []}
+    lexical = _components.get("lexical_index")
+    indexed = {"texts": [], "metadatas": [], "ids": []}  # kept only if BM25 is loaded
+
+    def flush():
+        if not batch["ids"]:
+            return
+        batches_sent[0] += 1
+        # add_texts embeds with the vector store's (shared, normalised) embedding
+        # function — NOT Chroma's built-in default model — so uploads score on
+        # the same scale as the base corpus.
+        vectorstore.add_texts(
+            texts=batch["texts"],
+            metadatas=batch["metadatas"],
+            ids=batch["ids"]
+        )
+        if lexical is not None:
+            for key, values in batch.items():
+                indexed[key].extend(values)
+        for values in batch.values():
+            values.clear()
+        progress(pages_read[0] / max(pages_total, 1),
+                 f"Indexing page {pages_read[0]} of {pages_total} ({len(chunk_ids)} sections)")
+
+    def counted(pages):
+        for page in pages:
+            pages_read[0] += 1
+            yield page
+
+    progress(0.0, f"Indexing {pages_total} pages")
+    completed = False
+    try:
+        for chunk in chunk_pages(counted(open_pages())):
+            chunk_id = f"upload_{session_id}_{uuid.uuid4().hex[:8]}"
+            chunk_ids.append(chunk_id)
+            batch["ids"].append(chunk_id)
+            batch["texts"].append(chunk.page_content)
+            batch["metadatas"].append({
+                **chunk.metadata,  # source, page range, character offsets
+                "session_id": session_id,
+                "uploaded": "true"
+            })
+            if len(batch["ids"]) >= INGEST_BATCH_SIZE:
+                flush()
+        flush()
+        completed = True
+    finally:
+        # Even if a later page or batch failed, earlier batches are already in
+        # Chroma (and /cleanup will find them) — so always bump. On failure we
+        # don't know exactly which rows landed, so every cache reloads instead
+        # of being patched in place.
+        if batches_sent[0]:
+            version_after = bump_corpus_version()  # cached answers may now be incomplete
+            if completed:
+                _note_own_change(version_before, version_after)
+                _update_lexical_index(version_before, version_after, add=indexed)
+
+    if not chunk_ids:
+        return {"chunks_added": 0, "chunk_ids": [], "error": "PDF contains no extractable text. It may be a scanned image."}
+
+    return {"chunks_added": len(chunk_ids), "chunk_ids": chunk_ids}
 
 
 def cleanup_session_chunks(session_id: str) -> dict:
     """Removes all chunks uploaded during this session."""
-    collection = vectorstore._collection
-    
     # results = collection.get(where={"session_id": session_id})
-    results = collection.get(where={"uploaded": "true"})
-    if results and results["ids"]:
-        collection.delete(ids=results["ids"])
-        return {"chunks_removed": len(results["ids"])}
+    with corpus_write_lock():
+        version_before = get_corpus_version()
+        collection = get_vectorstore()._collection
+        results = collection.get(where={"uploaded": "true"})
+        if results and results["ids"]:
+            collection.delete(ids=results["ids"])
+            version_after = bump_corpus_version()  # cached answers may cite removed chunks
+            _note_own_change(version_before, version_after)
+            _update_lexical_index(version_before, version_after, remove=results["ids"])
+            return {"chunks_removed": len(results["ids"])}
     
     return {"chunks_removed": 0}
 
+IMPORT_SECONDS = round(time.perf_counter() - _IMPORT_STARTED, 3)
+print(f"✅ rag_chain imported in {IMPORT_SECONDS * 1000:.0f} ms (models load on first use)")
+
 # ─────────────────────────────────────────────
 # Step 10: Interactive Terminal Chat Loop
 # ─────────────────────────────────────────────
 if __name__ == "__main__":
+    # The terminal chat is useless without the index and the LLM,
+    # so load everything up front and bail out early if anything is missing.
+    if not HUGGINGFACE_API_KEY:
+        sys.exit(1)
+    status = warm_up()
+    if not status["ready"] or not status["components"]["llm_warm"]:
+        sys.exit(1)
+
     print("\n" + "=" * 60)
     print("  UK Legal Document Assistant — Phase 2 Test")
     print("  Type  questions below. Type 'quit' to exit.")
@@ -322,7 +1203,7 @@ if __name__ == "__main__":
             break
 
         if user_input.lower() == "clear":
-            chat_history.clear()
+            session_store.clear(DEFAULT_SESSION)
             print("🗑️  Conversation memory cleared.\n")
             continue
 
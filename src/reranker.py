@@ -0,0 +1,175 @@
+"""
+Cross-encoder re-ranking
+========================
+What this does:
+    The retriever ranks chunks by cosine similarity between two separately
+    computed embeddings — fast, but coarse. A cross-encoder reads the
+    question and a chunk TOGETHER and scores how well the chunk answers
+    it, which is much more accurate (and much slower, so it only looks at
+    a shortlist).
+
+    With RERANK=1 retrieval over-fetches RERANK_CANDIDATES chunks (30),
+    the cross-encoder scores all question/chunk pairs in one batch, and
+    the best RETRIEVAL_K go to the LLM. Better chunks means RETRIEVAL_K can
+    be lowered, which shrinks the prompt.
+
+Latency budget:
+    Scoring runs on its own small pool. The caller waits at most
+    RERANK_BUDGET_MS per question, but never more than
+    RERANK_BATCH_BUDGET_MS for a whole /ask/batch — otherwise a 100
+    question batch could hold a request thread for 30s. Large batches
+    therefore fall back more often: by design, latency wins over ordering.
+    If scoring is slower — or the pool is already busy — the request falls
+    back to the retriever's own order.
+    A late scoring job still finishes in the background but is discarded.
+    If the model can't be loaded (no network for the download) or scoring
+    raises, every question falls back the same way; a failed load is not
+    retried until the API restarts.
+
+Settings:
+    RERANK=1                 turn it on (default off)
+    RERANK_MODEL             default cross-encoder/ms-marco-MiniLM-L-6-v2 (~90MB)
+    RERANK_CANDIDATES        chunks fetched for re-ranking (30)
+    RERANK_BUDGET_MS         time budget per question (300)
+    RERANK_BATCH_BUDGET_MS   cap on the budget of a multi-question batch (2000)
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from concurrency import BoundedExecutor, ExecutorSaturated
+
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_DEVICE = os.getenv("RERANK_DEVICE", os.getenv("EMBEDDING_DEVICE", "cpu"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_BUDGET_MS = int(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_BATCH_BUDGET_MS = int(os.getenv("RERANK_BATCH_BUDGET_MS", "2000"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_MAX_CONCURRENCY = int(os.getenv("RERANK_MAX_CONCURRENCY", "2"))
+RERANK_MAX_QUEUE = int(os.getenv("RERANK_MAX_QUEUE", "2"))
+
+
+class Reranker:
+    """Cross-encoder scoring with a hard time budget and retriever-order fallback."""
+
+    def __init__(self, model_name: str = RERANK_MODEL, device: str = RERANK_DEVICE,
+                 budget_ms: int = RERANK_BUDGET_MS, batch_budget_ms: int = RERANK_BATCH_BUDGET_MS):
+        self.model_name = model_name
+        self.device = device
+        self.budget_ms = budget_ms
+        self.batch_budget_ms = batch_budget_ms
+        self.executor = BoundedExecutor("rerank", RERANK_MAX_CONCURRENCY, RERANK_MAX_QUEUE)
+
+        self._model = None
+        self._load_error = None
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reranked = 0
+        self.timeouts = 0
+        self.busy = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_ms = None
+
+    def load(self):
+        """Loads the cross-encoder on first use (warm_up() calls this at startup)."""
+        with self._load_lock:
+            if self._load_error is not None:
+                raise self._load_error  # don't retry a failed download on every question
+            if self._model is None:
+                print(f"  Loading re-ranker '{self.model_name}' on {self.device}...")
+                try:
+                    # Imported here: pulls in torch + sentence-transformers (slow).
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(self.model_name, device=self.device)
+                except Exception as e:
+                    self._load_error = e
+                    raise
+                print("  Re-ranker loaded!")
+            return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def score(self, pairs: list) -> list:
+        return self.load().predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+
+    def rerank_batch(self, questions: list, candidates: list, k: int) -> list:
+        """
+        Best k Documents per question, re-ordered by cross-encoder score.
+        candidates[i] is the retriever's best-first list for questions[i];
+        its first k are the fallback when the budget is blown.
+
+        The budget is budget_ms per question, capped at batch_budget_ms
+        (but never below one question's budget).
+        """
+        fallback = [docs[:k] for docs in candidates]
+        pairs = [(q, doc.page_content) for q, docs in zip(questions, candidates) for doc in docs]
+        if not pairs:
+            return fallback
+
+        started = time.perf_counter()
+        try:
+            future = self.executor.submit(self.score, pairs)
+        except ExecutorSaturated:
+            with self._stats_lock:
+                self.busy += 1
+            return fallback
+        try:
+            scores = future.result(timeout=self.timeout_ms(len(questions)) / 1000)
+        except FutureTimeout:
+            with self._stats_lock:
+                self.timeouts += 1
+            return fallback
+        except Exception as e:
+            # Model failed to load or predict() raised: answer without re-ranking
+            error = f"{type(e).__name__}: {e}"
+            with self._stats_lock:
+                self.errors += 1
+                first = self.last_error != error
+                self.last_error = error
+            if first:
+                print(f"⚠️ Re-ranking failed ({error}) — using the retriever order")
+            return fallback
+
+        results = []
+        position = 0
+        for docs in candidates:
+            doc_scores = scores[position:position + len(docs)]
+            position += len(docs)
+            order = sorted(range(len(docs)), key=lambda i: -float(doc_scores[i]))[:k]
+            results.append([docs[i] for i in order])
+
+        with self._stats_lock:
+            self.reranked += len(questions)
+            self.last_ms = round((time.perf_counter() - started) * 1000, 1)
+        return results
+
+    def timeout_ms(self, questions: int) -> float:
+        return max(self.budget_ms, min(self.budget_ms * questions, self.batch_budget_ms))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "model": self.model_name,
+                "loaded": self.loaded,
+                "budget_ms": self.budget_ms,
+                "batch_budget_ms": self.batch_budget_ms,
+                "reranked": self.reranked,
+                "fallbacks_timeout": self.timeouts,
+                "fallbacks_busy": self.busy,
+                "fallbacks_error": self.errors,
+                "last_error": self.last_error,
+                "last_ms": self.last_ms,
+                "executor": self.executor.stats(),
+            }
+
+
+def create_reranker(enabled: bool = RERANK):
+    """Reranker, or None when RERANK is off."""
+    return Reranker() if enabled else None
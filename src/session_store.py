@@ -0,0 +1,281 @@
+"""
+Per-session conversation memory
+===============================
+What this does:
+    Follow-up questions ("and for part-time workers?") need the previous
+    turns. That history used to be ONE module-level list shared by every
+    user of the API — people saw each other's conversations, and it grew
+    forever.
+
+    A SessionStore keeps one history per session_id (app.py generates one
+    per browser tab) and keeps the whole thing bounded:
+      - SESSION_MAX_TURNS      turns kept per session (oldest dropped)
+      - SESSION_IDLE_TTL       seconds of inactivity before a session is forgotten
+      - SESSION_MAX_BYTES      ceiling for all sessions together; the least
+                               recently active sessions go first
+
+    Only the newest few turns ever reach the prompt (see prompt_budget.py),
+    so the per-session cap can stay small.
+
+Backends (SESSION_STORE_BACKEND):
+    memory  — in-process. Fine for one API worker (the default then).
+    sqlite  — SQLite file in WAL mode, shared by every worker process on
+              the machine, so a follow-up can land on any worker (the
+              default when API_WORKERS > 1).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from settings import API_WORKERS, CACHE_DIR, open_sqlite
+
+# Several API workers (API_WORKERS > 1) must see the same histories
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite" if API_WORKERS > 1 else "memory")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(CACHE_DIR, "sessions.sqlite3"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", str(2 * 3600)))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+DEFAULT_SESSION = "default"  # API callers that don't send a session_id share this one
+
+
+def turn_size(question: str, answer: str) -> int:
+    """Approximate memory cost of one turn (UTF-8 bytes of its text)."""
+    return len(question.encode("utf-8")) + len(answer.encode("utf-8"))
+
+
+class SessionStore:
+    """Shared bookkeeping: limits and eviction counters. Subclasses store the turns."""
+
+    backend = "none"
+
+    def __init__(self, max_turns: int = SESSION_MAX_TURNS, idle_ttl: int = SESSION_IDLE_TTL,
+                 max_bytes: int = SESSION_MAX_BYTES):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._stats_lock = threading.Lock()
+        self.expired = 0   # sessions dropped for being idle
+        self.evicted = 0   # sessions dropped to stay under max_bytes
+
+    def _count(self, expired: int = 0, evicted: int = 0):
+        if expired or evicted:
+            with self._stats_lock:
+                self.expired += expired
+                self.evicted += evicted
+
+    def get(self, session_id: str) -> list:
+        """[(question, answer), ...] oldest first — empty for unknown sessions."""
+        return []
+
+    def append(self, session_id: str, question: str, answer: str):
+        pass
+
+    def clear(self, session_id: str):
+        pass
+
+    def usage(self) -> tuple:
+        """(sessions, turns, bytes) currently held."""
+        return 0, 0, 0
+
+    def stats(self) -> dict:
+        sessions, turns, size = self.usage()
+        with self._stats_lock:
+            return {
+                "backend": self.backend,
+                "sessions": sessions,
+                "turns": turns,
+                "bytes": size,
+                "max_turns_per_session": self.max_turns,
+                "idle_ttl_seconds": self.idle_ttl,
+                "max_bytes": self.max_bytes,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    OrderedDict of sessions, least recently active first — so both idle
+    expiry and the memory ceiling only ever pop from the front.
+    """
+
+    backend = "memory"
+
+    def __init__(self, max_turns: int = SESSION_MAX_TURNS, idle_ttl: int = SESSION_IDLE_TTL,
+                 max_bytes: int = SESSION_MAX_BYTES):
+        super().__init__(max_turns, idle_ttl, max_bytes)
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session_id -> {"turns": [...], "bytes": n, "last_used": t}
+        self._bytes = 0
+
+    def _drop_oldest(self):
+        _, session = self._sessions.popitem(last=False)
+        self._bytes -= session["bytes"]
+
+    def _expire(self, now: float):
+        expired = 0
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest["last_used"] <= self.idle_ttl:
+                break
+            self._drop_oldest()
+            expired += 1
+        self._count(expired=expired)
+
+    def get(self, session_id: str) -> list:
+        with self._lock:
+            self._expire(time.time())
+            session = self._sessions.get(session_id)
+            return list(session["turns"]) if session is not None else []
+
+    def append(self, session_id: str, question: str, answer: str):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.setdefault(session_id, {"turns": [], "bytes": 0, "last_used": now})
+            session["turns"].append((question, answer))
+            size = turn_size(question, answer)
+            session["bytes"] += size
+            self._bytes += size
+            while len(session["turns"]) > self.max_turns:
+                size = turn_size(*session["turns"].pop(0))
+                session["bytes"] -= size
+                self._bytes -= size
+            session["last_used"] = now
+            self._sessions.move_to_end(session_id)
+
+            # Over the ceiling: forget whole sessions, least recently active first
+            # (never the one being written to)
+            evicted = 0
+            while self._bytes > self.max_bytes and len(self._sessions) > 1:
+                self._drop_oldest()
+                evicted += 1
+            self._count(evicted=evicted)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._bytes -= session["bytes"]
+
+    def usage(self) -> tuple:
+        with self._lock:
+            return (len(self._sessions),
+                    sum(len(s["turns"]) for s in self._sessions.values()),
+                    self._bytes)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite file (WAL mode: readers don't block the writer),
+    so every API worker on the machine sees the same histories.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = SESSION_STORE_PATH, max_turns: int = SESSION_MAX_TURNS,
+                 idle_ttl: int = SESSION_IDLE_TTL, max_bytes: int = SESSION_MAX_BYTES):
+        super().__init__(max_turns, idle_ttl, max_bytes)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,"
+                " question TEXT NOT NULL, answer TEXT NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY, last_used REAL NOT NULL, bytes INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+
+    def _delete_sessions(self, session_ids: list):
+        for session_id in session_ids:
+            self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _expire(self, now: float) -> int:
+        idle = [row[0] for row in self._conn.execute(
+            "SELECT session_id FROM sessions WHERE last_used < ?", (now - self.idle_ttl,)
+        )]
+        self._delete_sessions(idle)
+        return len(idle)
+
+    def get(self, session_id: str) -> list:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT last_used FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return []
+            if now - row[0] > self.idle_ttl:
+                self._delete_sessions([session_id])
+                self._count(expired=1)
+                return []
+            return self._conn.execute(
+                "SELECT question, answer FROM turns WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+
+    def append(self, session_id: str, question: str, answer: str):
+        now = time.time()
+        with self._lock, self._conn:
+            expired = self._expire(now)
+            self._conn.execute(
+                "INSERT INTO turns (session_id, question, answer, size) VALUES (?, ?, ?, ?)",
+                (session_id, question, answer, turn_size(question, answer)),
+            )
+            self._conn.execute(
+                "DELETE FROM turns WHERE session_id = ? AND id NOT IN ("
+                " SELECT id FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_turns),
+            )
+            size = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, last_used, bytes) VALUES (?, ?, ?)",
+                (session_id, now, size),
+            )
+
+            # Over the ceiling: forget whole sessions, least recently active first
+            total = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM sessions").fetchone()[0]
+            victims = []
+            if total > self.max_bytes:
+                for victim, victim_bytes in self._conn.execute(
+                    "SELECT session_id, bytes FROM sessions WHERE session_id != ? ORDER BY last_used",
+                    (session_id,),
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    victims.append(victim)
+                    total -= victim_bytes
+                self._delete_sessions(victims)
+        self._count(expired=expired, evicted=len(victims))
+
+    def clear(self, session_id: str):
+        with self._lock, self._conn:
+            self._delete_sessions([session_id])
+
+    def usage(self) -> tuple:
+        with self._lock:
+            sessions, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions"
+            ).fetchone()
+            turns = self._conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+            return sessions, turns, size
+
+
+def create_session_store(backend: str = SESSION_STORE_BACKEND) -> SessionStore:
+    """Builds the store selected by SESSION_STORE_BACKEND."""
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown SESSION_STORE_BACKEND '{backend}'. Choose memory or sqlite.")
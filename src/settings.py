@@ -0,0 +1,42 @@
+"""
+Shared paths and settings
+=========================
+What this does:
+    Paths and settings that several modules need, defined once here
+    instead of being re-derived in each of them. Imports nothing heavy,
+    so the API, build_db.py and the small stores can all use it.
+
+        PROJECT_ROOT   the repository root
+        CHROMA_PATH    chroma_db/ — ChromaDB plus everything built next to
+                       it (corpus version stamp, vector/BM25 exports)
+        CACHE_DIR      cache/ — SQLite stores, spooled uploads
+        API_WORKERS    uvicorn worker processes. With more than one, the
+                       answer cache, chat histories and upload jobs
+                       default to SQLite files so every worker shares them.
+
+    open_sqlite() is the connection setup those SQLite stores share.
+"""
+
+import os
+import sqlite3
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHROMA_PATH = os.path.join(PROJECT_ROOT, "chroma_db")
+CACHE_DIR = os.path.join(PROJECT_ROOT, "cache")
+
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+
+# Seconds a SQLite call waits for another worker's write lock before failing
+SQLITE_TIMEOUT = float(os.getenv("SQLITE_TIMEOUT", "10"))
+
+
+def open_sqlite(path: str, timeout: float = SQLITE_TIMEOUT) -> sqlite3.Connection:
+    """
+    Connection to a SQLite file shared by several threads (callers guard it
+    with their own lock) and worker processes. WAL mode: readers don't
+    block the writer.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
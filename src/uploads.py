@@ -0,0 +1,197 @@
+"""
+Streaming PDF uploads
+=====================
+What this does:
+    With `file: UploadFile`, FastAPI parses the WHOLE multipart body before
+    /upload even runs, and `await file.read()` then pulls up to 50MB into
+    memory — handed to PyMuPDF, which holds its own copy. Two copies per
+    concurrent upload is more than our 2GB droplet can spare.
+
+    receive_pdf() reads the request body as it arrives and writes the
+    file part straight into a temporary file under UPLOAD_DIR:
+      - a Content-Length over the limit, or a file name that isn't .pdf,
+        is refused before the file's bytes are read
+      - otherwise the limit is counted while streaming, and the upload is
+        cut off with 413 the moment it goes over
+    Only one network chunk (~64KB) is in memory at a time: it is parsed
+    on the event loop (cheap), and its file bytes are written out in a
+    worker thread (asyncio.to_thread) before the next chunk is read, so
+    a slow disk never stalls other requests. A body that ends before the
+    file part's closing boundary is rejected, not indexed half-read. The
+    indexing job then opens the PDF from the file path and deletes it
+    when done.
+
+Settings:
+    UPLOAD_MAX_BYTES   largest PDF accepted (default 50MB)
+    UPLOAD_DIR         where uploads wait for indexing (default cache/uploads)
+"""
+
+import asyncio
+import os
+import tempfile
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from settings import CACHE_DIR
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(CACHE_DIR, "uploads"))
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """The upload can't be accepted; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def too_large() -> UploadRejected:
+    return UploadRejected(413, f"File too large. Maximum {UPLOAD_MAX_BYTES // (1024 * 1024)}MB.")
+
+
+class _FilePartWriter:
+    """
+    MultipartParser callbacks: remembers each part's headers and collects
+    the body of the first part with a filename. The callbacks only buffer;
+    flush() does the (blocking) file I/O, so it can run off the event loop.
+    """
+
+    def __init__(self, field: str, max_bytes: int):
+        self.field = field
+        self.max_bytes = max_bytes
+        self.filename = None
+        self.path = None
+        self.size = 0
+        self._file = None
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._writing = False  # inside the file part
+        self._pending = []     # file bytes parsed but not yet flushed
+        self.parts_completed = 0
+        self.file_completed = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if name == self.field and filename is not None and self.filename is None:
+            self.filename = os.path.basename(filename.decode("utf-8", "replace"))
+            if not self.filename.lower().endswith(".pdf"):
+                raise UploadRejected(400, "Only PDF files are accepted.")  # before reading the body
+            self._writing = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if not self._writing:
+            return
+        self.size += end - start
+        if self.size > self.max_bytes:
+            raise too_large()
+        self._pending.append(data[start:end])
+
+    def on_part_end(self):
+        self.parts_completed += 1
+        if self._writing:
+            self._writing = False
+            self.file_completed = True
+
+    def flush(self):
+        """Writes the buffered file bytes to the temporary file (blocking)."""
+        if self.filename is None or (self._file is not None and self._file.closed):
+            return  # no file part yet, or it is already complete on disk
+        if self._file is None:
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            handle, self.path = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_DIR)
+            self._file = os.fdopen(handle, "wb")
+        self._file.writelines(self._pending)
+        self._pending.clear()
+        if self.file_completed:
+            self._file.close()
+
+    @property
+    def truncated(self) -> bool:
+        """The body ended inside a part (no closing boundary), or before any part."""
+        return self._writing or self.parts_completed == 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def discard(self):
+        self.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def receive_pdf(request, field: str = "file", max_bytes: int = UPLOAD_MAX_BYTES) -> tuple:
+    """
+    Streams the multipart `field` of a request into a temporary file.
+    Returns (path, filename, size). The caller owns the file and must
+    delete it. Raises UploadRejected for anything we won't accept.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD:
+        raise too_large()  # refused before reading the body
+
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadRejected(400, "Expected a multipart/form-data upload with a 'file' field.")
+
+    writer = _FilePartWriter(field, max_bytes)
+    parser = MultipartParser(options[b"boundary"], writer.callbacks())
+    received = False
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                parser.write(chunk)
+                await asyncio.to_thread(writer.flush)  # at most one chunk buffered
+        parser.finalize()
+        await asyncio.to_thread(writer.flush)
+        if writer.truncated:
+            raise UploadRejected(400, "Malformed upload.")
+        received = True
+    except UploadRejected:
+        raise
+    except Exception as e:
+        raise UploadRejected(400, "Malformed upload.") from e
+    finally:
+        # Every way out closes the file; anything but success also deletes it
+        # (including a cancelled request)
+        if received:
+            writer.close()
+        else:
+            writer.discard()
+
+    if writer.path is None:
+        raise UploadRejected(400, f"No '{field}' file in the upload.")
+    return writer.path, writer.filename, writer.size
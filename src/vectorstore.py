@@ -8,9 +8,10 @@ What this does:
 """
 
 from langchain_chroma import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from embeddings import get_embeddings, EMBEDDING_MODEL
 from pdf_loader import load_all_pdfs
 from chunker import chunk_text
+from settings import CHROMA_PATH
 import os
 import sys
 import shutil
@@ -22,31 +23,18 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 # Where to save the database on  hard drive
 # CHROMA_DB_DIR = "chroma_db"
 
-CHROMA_DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chroma_db")
-
-# The Hugging Face model for embeddings (free, runs locally)
-# "all-MiniLM-L6-v2" is small (~90MB), fast, and very good quality
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CHROMA_DB_DIR = CHROMA_PATH
 
 
 def get_embedding_function():
     """
-    Creates the embedding function using Hugging Face.
-    
-    First time: Downloads the model from the internet (~90MB).
-    After that: Uses the cached version from  machine (no internet needed).
-    """
-    print("  Loading Hugging Face embedding model...")
-    print("  (First run downloads ~90MB model. After that, it's instant.)")
+    Returns the shared embedding function (see embeddings.py).
 
-    embeddings = HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL,
-        model_kwargs={"device": "cpu"},  # Use CPU (works on any machine)
-        encode_kwargs={"normalize_embeddings": True}  # Better search results
-    )
-
-    print("  Embedding model loaded!")
-    return embeddings
+    The same instance is used by the build, the query path and uploads,
+    so the model is loaded once per process and every chunk is embedded
+    the same way.
+    """
+    return get_embeddings(EMBEDDING_MODEL)
 
 
 def create_vectorstore(chunks: list, force_rebuild: bool = False):
@@ -0,0 +1,9 @@
+"""
+Shared test setup: the modules under test live in src/ and import each
+other as top-level modules (the same way the scripts and the API run).
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from answer_cache import (
+    InMemoryAnswerCache,
+    SQLiteAnswerCache,
+    SemanticAnswerCache,
+    create_semantic_cache,
+    make_key,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return InMemoryAnswerCache(**kwargs)
+        return SQLiteAnswerCache(path=str(tmp_path / "answers.sqlite3"), **kwargs)
+    return make
+
+
+def test_key_normalises_the_question():
+    assert make_key("  What about SICK pay?? ", k=4) == make_key("what about sick pay", k=4)
+    assert make_key("sick pay", k=4) != make_key("sick pay", k=5)
+
+
+def test_lru_evicts_least_recently_used(make_cache):
+    cache = make_cache(max_entries=2)
+    cache.set("a", {"answer": "A"})
+    cache.set("b", {"answer": "B"})
+    assert cache.get("a") == {"answer": "A"}  # a is now the most recent
+    cache.set("c", {"answer": "C"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"answer": "A"}
+    assert cache.get("c") == {"answer": "C"}
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(make_cache):
+    cache = make_cache(ttl=-1)  # everything is already too old
+    cache.set("a", {"answer": "A"})
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (0, 1)
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "answers.sqlite3")
+    SQLiteAnswerCache(path=path).set("a", {"answer": "A"})
+    assert SQLiteAnswerCache(path=path).get("a") == {"answer": "A"}
+
+
+def test_semantic_cache_needs_similar_question_and_same_chunks():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=4)
+    cache.set("scope", [1.0, 0.0, 0.0], ["c1", "c2"], {"answer": "A"})
+    assert cache.get("scope", [0.99, 0.05, 0.0], ["c2", "c1"]) == {"answer": "A"}
+    assert cache.get("scope", [0.99, 0.05, 0.0], ["c1", "c3"]) is None   # other chunks
+    assert cache.get("scope", [0.0, 1.0, 0.0], ["c1", "c2"]) is None     # not similar
+    assert cache.get("other", [1.0, 0.0, 0.0], ["c1", "c2"]) is None     # other scope
+    assert cache.stats()["near_misses"] == 1
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2)
+    vectors = np.eye(3)
+    cache.set("s", vectors[0], ["a"], {"answer": "0"})
+    cache.set("s", vectors[1], ["b"], {"answer": "1"})
+    assert cache.get("s", vectors[0], ["a"]) == {"answer": "0"}
+    cache.set("s", vectors[2], ["c"], {"answer": "2"})
+    assert cache.get("s", vectors[1], ["b"]) is None
+    assert cache.get("s", vectors[0], ["a"]) == {"answer": "0"}
+    assert len(cache) == 2
+
+
+def test_semantic_cache_size_zero_disables_it():
+    assert create_semantic_cache(enabled=True, max_entries=0) is None
@@ -0,0 +1,37 @@
+from langchain_core.documents import Document
+
+from build_db import chunk_ids_and_hashes
+
+
+def doc(text: str, **metadata) -> Document:
+    return Document(page_content=text, metadata={"source": "act.pdf", **metadata})
+
+
+def test_ids_are_stable_and_repeats_are_suffixed():
+    chunks = [doc("Header", page=1), doc("Body text", page=1), doc("Header", page=2)]
+    ids = [chunk_id for chunk_id, _ in chunk_ids_and_hashes("act.pdf", chunks)]
+    assert ids == [chunk_id for chunk_id, _ in chunk_ids_and_hashes("act.pdf", chunks)]
+    assert len(set(ids)) == 3
+    assert ids[2] == f"{ids[0]}-2"
+
+
+def test_id_depends_on_file_and_text_only():
+    first, = chunk_ids_and_hashes("act.pdf", [doc("Body text", char_start=0)])
+    moved, = chunk_ids_and_hashes("act.pdf", [doc("Body text", char_start=500)])
+    other, = chunk_ids_and_hashes("other.pdf", [doc("Body text", char_start=0)])
+    assert first[0] == moved[0]
+    assert first[0] != other[0]
+
+
+def test_text_and_metadata_hashes_change_independently():
+    (_, (text_hash, meta_hash)), = chunk_ids_and_hashes("act.pdf", [doc("Body text", page_start=1)])
+    (_, (same_text, new_meta)), = chunk_ids_and_hashes("act.pdf", [doc("Body text", page_start=2)])
+    (_, (new_text, same_meta)), = chunk_ids_and_hashes("act.pdf", [doc("Body text!", page_start=1)])
+    assert same_text == text_hash and new_meta != meta_hash
+    assert new_text != text_hash and same_meta == meta_hash
+
+
+def test_metadata_hash_ignores_key_order():
+    (_, (_, a)), = chunk_ids_and_hashes("act.pdf", [Document(page_content="x", metadata={"a": 1, "b": 2})])
+    (_, (_, b)), = chunk_ids_and_hashes("act.pdf", [Document(page_content="x", metadata={"b": 2, "a": 1})])
+    assert a == b
@@ -0,0 +1,61 @@
+from chunker import chunk_pages
+
+PAGES = [
+    ("act.pdf", 1, "Employers must offer guaranteed hours. " * 40),
+    ("act.pdf", 2, "Statutory sick pay is payable from the first day. " * 30),
+    ("act.pdf", 3, "Short page."),
+    ("act.pdf", 4, "Unfair dismissal protection applies from day one. " * 50),
+]
+
+
+def document_text(pages) -> str:
+    # chunk_pages() joins pages with a newline after each one
+    return "".join(text + "\n" for _, _, text in pages)
+
+
+def page_of(pages, offset: int) -> int:
+    start = 0
+    for _, number, text in pages:
+        end = start + len(text) + 1
+        if offset < end:
+            return number
+        start = end
+    return pages[-1][1]
+
+
+def test_offsets_point_at_the_chunk_text():
+    text = document_text(PAGES)
+    chunks = list(chunk_pages(iter(PAGES), chunk_size=200, chunk_overlap=40))
+    assert len(chunks) > 10
+    for chunk in chunks:
+        meta = chunk.metadata
+        assert text[meta["char_start"]:meta["char_end"]] == chunk.page_content
+
+
+def test_page_range_covers_the_chunk():
+    chunks = list(chunk_pages(iter(PAGES), chunk_size=200, chunk_overlap=40))
+    for chunk in chunks:
+        meta = chunk.metadata
+        assert meta["page_start"] == page_of(PAGES, meta["char_start"])
+        assert meta["page_end"] == page_of(PAGES, meta["char_end"] - 1)
+        expected = str(meta["page_start"]) if meta["page_start"] == meta["page_end"] \
+            else f"{meta['page_start']}-{meta['page_end']}"
+        assert meta["page"] == expected
+    # Chunks flow across page boundaries
+    assert any(c.metadata["page_start"] != c.metadata["page_end"] for c in chunks)
+
+
+def test_every_page_is_covered_in_order():
+    chunks = list(chunk_pages(iter(PAGES), chunk_size=200, chunk_overlap=40))
+    starts = [c.metadata["char_start"] for c in chunks]
+    assert starts == sorted(starts)
+    assert {c.metadata["page_start"] for c in chunks} >= {1, 2, 4}
+    assert chunks[-1].metadata["char_end"] >= len(document_text(PAGES).rstrip())
+
+
+def test_offsets_restart_per_source():
+    pages = [("a.pdf", 1, "Alpha text. " * 30), ("b.pdf", 1, "Beta text. " * 30)]
+    chunks = list(chunk_pages(iter(pages), chunk_size=100, chunk_overlap=20))
+    b_chunks = [c for c in chunks if c.metadata["source"] == "b.pdf"]
+    assert b_chunks and b_chunks[0].metadata["char_start"] == 0
+    assert all("Beta" in c.page_content for c in b_chunks)
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+import corpus_version
+
+
+@pytest.fixture(autouse=True)
+def stamp_dir(tmp_path, monkeypatch):
+    chroma = tmp_path / "chroma_db"
+    monkeypatch.setattr(corpus_version, "CHROMA_PATH", str(chroma))
+    monkeypatch.setattr(corpus_version, "VERSION_PATH", str(chroma / "corpus_version"))
+    monkeypatch.setattr(corpus_version, "WRITE_LOCK_PATH", str(tmp_path / "chroma_db.lock"))
+    monkeypatch.setattr(corpus_version, "_cached", {"stat": None, "version": None})
+    return chroma
+
+
+def test_missing_stamp_is_not_created_by_readers(stamp_dir):
+    assert corpus_version.get_corpus_version() == corpus_version.MISSING_VERSION
+    assert not (stamp_dir / "corpus_version").exists()
+
+
+def test_bump_changes_the_version():
+    first = corpus_version.bump_corpus_version()
+    assert corpus_version.get_corpus_version() == first
+    second = corpus_version.bump_corpus_version()
+    assert second != first
+    assert corpus_version.get_corpus_version() == second
+
+
+def test_bump_to_a_given_version():
+    assert corpus_version.bump_corpus_version("exported") == "exported"
+    assert corpus_version.get_corpus_version() == "exported"
+
+
+def test_change_by_another_process_is_seen(stamp_dir):
+    corpus_version.bump_corpus_version()
+    # Another process replacing the file: a new inode, even within one mtime tick
+    tmp = stamp_dir / "other.tmp"
+    tmp.write_text("theirs")
+    tmp.replace(stamp_dir / "corpus_version")
+    assert corpus_version.get_corpus_version() == "theirs"
+
+
+def test_write_lock_serialises_writers():
+    inside = []
+    overlaps = []
+
+    def writer():
+        with corpus_version.corpus_write_lock():
+            inside.append(1)
+            overlaps.append(len(inside))
+            time.sleep(0.02)
+            inside.pop()
+
+    threads = [threading.Thread(target=writer) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [1, 1, 1, 1]
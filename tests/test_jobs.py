@@ -0,0 +1,54 @@
+import pytest
+
+from jobs import STALE_ERROR, InMemoryJobStore, SQLiteJobStore, run_job
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return InMemoryJobStore(**kwargs)
+        return SQLiteJobStore(path=str(tmp_path / "jobs.sqlite3"), **kwargs)
+    return make
+
+
+def test_run_job_records_progress_and_result(make_store):
+    store = make_store()
+    job = store.create("ingest", filename="a.pdf")
+    seen = []
+
+    def work(progress=None):
+        progress(0.5, "Halfway")
+        seen.append(store.get(job["job_id"])["stage"])
+        return {"chunks_added": 3}
+
+    run_job(store, job["job_id"], work)
+    done = store.get(job["job_id"])
+    assert seen == ["Halfway"]
+    assert (done["status"], done["progress"], done["result"]) == ("done", 1.0, {"chunks_added": 3})
+    assert done["filename"] == "a.pdf"
+
+
+def test_errors_mark_the_job_failed(make_store):
+    store = make_store()
+    raising = store.create("ingest")
+    returning = store.create("ingest")
+
+    def boom(progress=None):
+        raise ValueError("bad PDF")
+
+    run_job(store, raising["job_id"], boom)
+    run_job(store, returning["job_id"], lambda progress=None: {"error": "no text"})
+    assert store.get(raising["job_id"])["error"] == "ValueError: bad PDF"
+    assert store.get(returning["job_id"])["status"] == "failed"
+
+
+def test_unfinished_jobs_go_stale(make_store):
+    store = make_store(ttl=-1)  # no progress report is recent enough
+    job = store.create("ingest")
+    stale = store.get(job["job_id"])
+    assert (stale["status"], stale["error"]) == ("failed", STALE_ERROR)
+
+
+def test_unknown_job_is_none(make_store):
+    assert make_store().get("nope") is None
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from numpy_index import LayeredVectorIndex, NumpyVectorIndex, current_export, export_index, quantise
+
+DIM = 32
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, DIM)).astype(np.float32)
+    ids = [f"c{i}" for i in range(len(vectors))]
+    texts = [f"chunk {i}" for i in range(len(vectors))]
+    metadatas = [{"source": "a.pdf" if i % 2 else "b.pdf", "page_start": i, "page_end": i}
+                 for i in range(len(vectors))]
+    # Queries close to known chunks, so the exact top hit is unambiguous
+    queries = vectors[[3, 50, 120]] + rng.normal(scale=0.05, size=(3, DIM)).astype(np.float32)
+    return ids, vectors, texts, metadatas, queries
+
+
+def exact_top_k(vectors, queries, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [list(np.argsort(-(vectors @ q))[:k]) for q in queries]
+
+
+def test_float32_search_is_exact(corpus):
+    ids, vectors, texts, metadatas, queries = corpus
+    index = NumpyVectorIndex(ids, vectors, texts, metadatas)
+    hits = index.search_batch(queries, k=5)
+    assert [[doc.id for doc in row] for row in hits] == \
+        [[ids[i] for i in row] for row in exact_top_k(vectors, queries, 5)]
+
+
+def test_int8_quantisation_roundtrip():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(10, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    stored, scales = quantise(vectors, "int8")
+    assert stored.dtype == np.int8
+    assert np.abs(stored.astype(np.float32) * scales[:, None] - vectors).max() < 0.01
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantised_export_rescores_exactly(corpus, tmp_path, dtype):
+    ids, vectors, texts, metadatas, queries = corpus
+    path = export_index(ids, vectors, texts, metadatas, dtype=dtype, root=str(tmp_path), rescore=True)
+    index = NumpyVectorIndex.from_mapped(path)
+    assert index.vectors.dtype == np.dtype(dtype)
+    assert index.exact_vectors is not None
+
+    scored = index.search_scored_batch(queries, k=5)
+    expected = exact_top_k(vectors, queries, 5)
+    assert [[doc.id for _, doc in row] for row in scored] == [[ids[i] for i in row] for row in expected]
+    # Re-scored against the float32 originals: the scores are the exact cosines
+    normalised = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = queries[0] / np.linalg.norm(queries[0])
+    assert scored[0][0][0] == pytest.approx(float(normalised[expected[0][0]] @ query), abs=1e-5)
+
+
+def test_export_without_rescoring_skips_originals(corpus, tmp_path):
+    ids, vectors, texts, metadatas, queries = corpus
+    path = export_index(ids, vectors, texts, metadatas, dtype="int8", root=str(tmp_path), rescore=False)
+    index = NumpyVectorIndex.from_mapped(path)
+    assert index.exact_vectors is None
+    assert current_export(str(tmp_path))[1]["exact"] is False
+    assert len(index.search(queries[0], k=5)) == 5
+
+
+def test_mapped_export_keeps_texts_metadata_and_filters(corpus, tmp_path):
+    ids, vectors, texts, metadatas, queries = corpus
+    export_index(ids, vectors, texts, metadatas, root=str(tmp_path), info={"corpus_version": "v1"})
+    path, info = current_export(str(tmp_path))
+    assert (info["count"], info["dim"], info["corpus_version"]) == (200, DIM, "v1")
+
+    index = NumpyVectorIndex.from_mapped(path)
+    docs = index.search(queries[0], k=10, filters={"source": "a.pdf", "page_from": 10, "page_to": 150})
+    assert docs
+    for doc in docs:
+        assert doc.page_content == texts[int(doc.id[1:])]
+        assert doc.metadata["source"] == "a.pdf" and 10 <= doc.metadata["page_start"] <= 150
+
+
+def test_layered_index_merges_upload_overlay(corpus):
+    ids, vectors, texts, metadatas, queries = corpus
+    base = NumpyVectorIndex(ids, vectors, texts, metadatas)
+    upload = NumpyVectorIndex(["u1"], queries[:1], ["uploaded"], [{"source": "u.pdf"}])
+    hits = LayeredVectorIndex([base, upload, None]).search(queries[0], k=3)
+    assert hits[0].id == "u1"
+    assert len(hits) == 3
@@ -0,0 +1,56 @@
+import pytest
+
+from session_store import InMemorySessionStore, SQLiteSessionStore, turn_size
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return InMemorySessionStore(**kwargs)
+        return SQLiteSessionStore(path=str(tmp_path / "sessions.sqlite3"), **kwargs)
+    return make
+
+
+def test_sessions_are_kept_apart(make_store):
+    store = make_store()
+    store.append("alice", "q1", "a1")
+    store.append("bob", "q2", "a2")
+    assert [tuple(t) for t in store.get("alice")] == [("q1", "a1")]
+    assert [tuple(t) for t in store.get("bob")] == [("q2", "a2")]
+    assert store.get("carol") == []
+
+
+def test_only_the_last_max_turns_are_kept(make_store):
+    store = make_store(max_turns=2)
+    for i in range(4):
+        store.append("s", f"q{i}", f"a{i}")
+    assert [tuple(t) for t in store.get("s")] == [("q2", "a2"), ("q3", "a3")]
+    assert store.usage() == (1, 2, turn_size("q2", "a2") + turn_size("q3", "a3"))
+
+
+def test_idle_sessions_expire(make_store):
+    store = make_store(idle_ttl=-1)  # idle for longer than the TTL straight away
+    store.append("s", "q", "a")
+    assert store.get("s") == []
+    assert store.stats()["expired"] == 1
+
+
+def test_byte_ceiling_drops_least_recently_active_sessions(make_store):
+    size = turn_size("q" * 10, "a" * 10)
+    store = make_store(max_bytes=2 * size)
+    store.append("old", "q" * 10, "a" * 10)
+    store.append("mid", "q" * 10, "a" * 10)
+    store.append("new", "q" * 10, "a" * 10)
+    assert store.get("old") == []
+    assert store.get("mid") and store.get("new")
+    assert store.stats()["evicted"] == 1
+
+
+def test_clear_forgets_one_session(make_store):
+    store = make_store()
+    store.append("a", "q", "a")
+    store.append("b", "q", "a")
+    store.clear("a")
+    assert store.get("a") == []
+    assert store.usage()[0] == 1
@@ -0,0 +1,103 @@
+import asyncio
+import os
+
+import pytest
+
+import uploads
+from uploads import UploadRejected, receive_pdf
+
+BOUNDARY = "XyZ"
+
+
+def multipart(filename: str = "act.pdf", content: bytes = b"%PDF-1.4 body", field: str = "file") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+class FakeRequest:
+    """Just what receive_pdf() uses of a Starlette Request."""
+
+    def __init__(self, body: bytes, chunk_size: int = 7, content_length: int = None):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.headers = {
+            "content-type": f"multipart/form-data; boundary={BOUNDARY}",
+            "content-length": str(len(body) if content_length is None else content_length),
+        }
+
+    async def stream(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def receive(request, **kwargs):
+    return asyncio.run(receive_pdf(request, **kwargs))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_file_part_is_written_to_disk(chunk_size, upload_dir):
+    path, filename, size = receive(FakeRequest(multipart(), chunk_size=chunk_size))
+    with open(path, "rb") as f:
+        assert f.read() == b"%PDF-1.4 body"
+    assert (filename, size) == ("act.pdf", 13)
+    assert os.path.dirname(path) == str(upload_dir)
+
+
+@pytest.mark.parametrize("cut", [5, 30, 60])
+def test_truncated_body_is_rejected_and_deleted(cut, upload_dir):
+    body = multipart(content=b"%PDF-1.4 " + b"x" * 100)
+    with pytest.raises(UploadRejected) as e:
+        receive(FakeRequest(body[:-cut]))
+    assert e.value.status_code == 400
+    assert os.listdir(upload_dir) == []
+
+
+def test_empty_body_is_rejected():
+    with pytest.raises(UploadRejected) as e:
+        receive(FakeRequest(b""))
+    assert e.value.status_code == 400
+
+
+def test_non_pdf_is_refused():
+    with pytest.raises(UploadRejected) as e:
+        receive(FakeRequest(multipart(filename="notes.txt")))
+    assert e.value.detail == "Only PDF files are accepted."
+
+
+def test_missing_file_field():
+    with pytest.raises(UploadRejected) as e:
+        receive(FakeRequest(multipart(field="attachment")))
+    assert e.value.detail == "No 'file' file in the upload."
+
+
+def test_oversized_content_length_is_refused_before_reading():
+    request = FakeRequest(multipart(), content_length=10 ** 12)
+    request.stream = None  # reading the body would fail
+    with pytest.raises(UploadRejected) as e:
+        receive(request, max_bytes=1000)
+    assert e.value.status_code == 413
+
+
+def test_oversized_stream_is_cut_off_and_deleted(upload_dir):
+    request = FakeRequest(multipart(content=b"x" * 5000), content_length=0)
+    with pytest.raises(UploadRejected) as e:
+        receive(request, max_bytes=1000)
+    assert e.value.status_code == 413
+    assert os.listdir(upload_dir) == []
+
+
+def test_wrong_content_type():
+    request = FakeRequest(multipart())
+    request.headers["content-type"] = "application/pdf"
+    with pytest.raises(UploadRejected) as e:
+        receive(request)
+    assert e.value.status_code == 400